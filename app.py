@@ -4,13 +4,32 @@ Windows Authentication with HTML Form Login
 """
 
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
-import pyodbc
 import pandas as pd
+import atexit
+import base64
 import hashlib
-from datetime import timedelta
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import hmac
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.decomposition import TruncatedSVD
 import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+try:
+    import pyodbc
+except ImportError:  # Only needed for the MSSQL storage backend
+    pyodbc = None
 
 # ============================================================================
 # Flask App Configuration
@@ -26,14 +45,25 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 # ============================================================================
 # Database Configuration (Windows Authentication)
 # ============================================================================
+# 'mssql' (SQL Server via pyodbc) or 'sqlite' (local file, e.g. for Linux
+# development and benchmark boxes)
+STORAGE_BACKEND = os.environ.get('MOVIERECOMM_STORAGE', 'mssql')
+
 DB_CONFIG = {
     'server': 'LAPTOP-B0N4O9L6\\MSSQLSERVERDB',
     'database': 'MovieRecommDB',
     'driver': '{ODBC Driver 17 for SQL Server}'
 }
 
+SQLITE_CONFIG = {
+    'path': os.environ.get('MOVIERECOMM_SQLITE_PATH', 'movierecomm.db'),
+    'cached_statements': 256  # Per-connection prepared statement cache
+}
+
 def get_db_connection():
     """Create database connection using Windows Authentication"""
+    if pyodbc is None:
+        raise RuntimeError("pyodbc is not installed; set MOVIERECOMM_STORAGE=sqlite or install it")
     conn_str = (
         f"DRIVER={DB_CONFIG['driver']};"
         f"SERVER={DB_CONFIG['server']};"
@@ -42,103 +72,2790 @@ def get_db_connection():
     )
     return pyodbc.connect(conn_str)
 
-# ============================================================================
-# Database Initialization
-# ============================================================================
-def init_database():
-    """Initialize database tables"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Create Users table
-        cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Users' AND xtype='U')
-            CREATE TABLE Users (
-                user_id INT IDENTITY(1,1) PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                created_at DATETIME DEFAULT GETDATE()
-            )
-        """)
+def get_sqlite_connection():
+    """Create a SQLite connection in WAL mode"""
+    conn = sqlite3.connect(SQLITE_CONFIG['path'], timeout=10, check_same_thread=False,
+                           cached_statements=SQLITE_CONFIG['cached_statements'])
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+# ============================================================================
+# Database Connection Pool
+# ============================================================================
+DB_POOL_CONFIG = {
+    'max_size': int(os.environ.get('MOVIERECOMM_DB_POOL_SIZE', 10)),
+    'timeout': 5.0,             # Seconds to wait for a free connection
+    'max_idle_seconds': 300,    # Idle connections older than this are closed
+    'ping_after_seconds': 5     # Idle connections older than this are pinged on checkout
+}
+
+class PoolTimeout(Exception):
+    """No connection became available within the pool timeout"""
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of reusable DB-API connections"""
+
+    def __init__(self, connect, max_size=10, timeout=5.0, max_idle_seconds=300,
+                 ping_after_seconds=5, ping_sql='SELECT 1'):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.ping_after_seconds = ping_after_seconds
+        self.ping_sql = ping_sql
+        
+        self._idle = deque()  # (connection, returned_at), most recently used on the right
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            'created': 0, 'closed': 0, 'checkouts': 0, 'waits': 0,
+            'wait_seconds': 0.0, 'timeouts': 0, 'failed_pings': 0, 'evicted_idle': 0
+        }
+
+    def _close(self, conn):
+        self._metrics['closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now):
+        """Close connections idle longer than max_idle_seconds (caller holds the lock)"""
+        while self._idle and now - self._idle[0][1] > self.max_idle_seconds:
+            conn, _ = self._idle.popleft()
+            self._metrics['evicted_idle'] += 1
+            self._close(conn)
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.ping_sql)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Check out a healthy connection, creating one if the pool has room"""
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                self._evict_idle(time.monotonic())
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                
+                self._in_use += 1
+                self._metrics['checkouts'] += 1
+                if waited:
+                    self._metrics['waits'] += 1
+                    self._metrics['wait_seconds'] += time.monotonic() - started
+                idle = self._idle.pop() if self._idle else None
+            
+            # Network work happens outside the lock
+            if idle is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self._metrics['created'] += 1
+                return conn
+            
+            conn, returned_at = idle
+            if time.monotonic() - returned_at < self.ping_after_seconds or self._is_healthy(conn):
+                return conn
+            
+            with self._cond:
+                self._metrics['failed_pings'] += 1
+                self._close(conn)
+            self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if `discard` is set"""
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            # Roll back whatever the caller left half done; a connection that
+            # cannot even roll back is broken and is not reused
+            try:
+                conn.rollback()
+            except Exception:
+                self.release(conn, discard=True)
+                raise
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection (in-use ones are closed on release)"""
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.popleft()[0])
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update({
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'avg_wait_ms': (1000 * stats['wait_seconds'] / stats['waits']) if stats['waits'] else 0.0
+            })
+        return stats
+
+# ============================================================================
+# Storage Backends
+# ============================================================================
+class DuplicateUserError(Exception):
+    """Username or email is already registered"""
+
+# Tables keyed by movie id -> (primary key, timestamp column), for migrate_movie_ids()
+MOVIE_ID_TABLES = {
+    'UserPreferences': ('pref_id', 'watched_date'),
+    'Watchlist': ('watchlist_id', 'added_date'),
+}
+
+class UserStore:
+    """Users, preferences, watchlist and activity on top of a pooled DB-API driver
+
+    Both drivers use the qmark paramstyle, so only the schema and the few
+    statements whose syntax differs live in the subclasses.
+    """
+
+    name = None
+    SCHEMA = []
+    SQL = {}
+    integrity_errors = ()
+
+    def __init__(self, connect):
+        self.pool = ConnectionPool(connect, **DB_POOL_CONFIG)
+
+    def init_schema(self):
+        """Create any missing tables and indexes"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            for statement in self.SCHEMA:
+                cursor.execute(statement)
+            conn.commit()
+
+    def movie_ids_migrated(self):
+        """True once UserPreferences and Watchlist are keyed by movie id"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            return all(self._movie_id_column(cursor, table) == 'key' for table in MOVIE_ID_TABLES)
+
+    def migrate_movie_ids(self, resolve, delete_unmatched=False):
+        """Re-key title-keyed UserPreferences and Watchlist rows by movie id
+
+        `resolve(title)` returns the catalog id for a stored title, or None.
+        Unresolvable rows abort the migration unless `delete_unmatched`, and
+        duplicate (user, movie) rows keep the most recent. Everything runs in
+        one transaction. Returns {table: {'rows', 'unmatched', 'duplicates'}}.
+        """
+        report = {}
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            self._begin(cursor)
+            for table, (key, date_column) in MOVIE_ID_TABLES.items():
+                if self._movie_id_column(cursor, table) == 'key':
+                    continue
+                self._add_movie_id_column(cursor, table)
+                
+                cursor.execute(f"SELECT DISTINCT movie_title FROM {table} "
+                               "WHERE movie_id IS NULL AND movie_title IS NOT NULL")
+                resolved = [(resolve(title), title) for (title,) in cursor.fetchall()]
+                updates = [(movie_id, title) for movie_id, title in resolved if movie_id is not None]
+                if updates:
+                    cursor.executemany(f"UPDATE {table} SET movie_id = ? "
+                                       "WHERE movie_id IS NULL AND movie_title = ?", updates)
+                
+                cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE movie_id IS NULL")
+                unmatched = cursor.fetchone()[0]
+                if unmatched and not delete_unmatched:
+                    raise ValueError(f"{unmatched} {table} rows match no movie in the catalog")
+                cursor.execute(f"DELETE FROM {table} WHERE movie_id IS NULL")
+                
+                duplicates = self._rekey_table(cursor, table, key, date_column)
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                report[table] = {'rows': cursor.fetchone()[0], 'unmatched': unmatched,
+                                 'duplicates': duplicates}
+            conn.commit()
+        return report
+
+    # --- Users ---------------------------------------------------------------
+    def create_user(self, username, email, password_hash):
+        """Register a user; raises DuplicateUserError if the name or email is taken"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT INTO Users (username, email, password_hash) VALUES (?, ?, ?)",
+                    (username, email, password_hash)
+                )
+                conn.commit()
+        except self.integrity_errors as e:
+            raise DuplicateUserError(str(e)) from e
+
+    def authenticate(self, username, password_hash):
+        """(user_id, username, email) for matching credentials, else None"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT user_id, username, email FROM Users WHERE username = ? AND password_hash = ?",
+                (username, password_hash)
+            )
+            row = cursor.fetchone()
+        return tuple(row) if row else None
+
+    # --- Preferences -----------------------------------------------------------
+    def add_preference(self, user_id, movie_id, movie_title=None, rating=None, is_favorite=False):
+        """Insert or update a user's rating for a movie (the title is kept for display)"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL['upsert_preference'],
+                           self._upsert_preference_params(user_id, movie_id, movie_title,
+                                                          rating, is_favorite))
+            conn.commit()
+
+    def add_preferences(self, user_id, items):
+        """Insert or update many (movie_id, movie_title, rating, is_favorite)
+        ratings with one batched statement in a single transaction"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(self.SQL['upsert_preference'],
+                               [self._upsert_preference_params(user_id, *item) for item in items])
+            conn.commit()
+
+    def remove_preference(self, user_id, movie_id):
+        """Delete a user's rating for a movie; True if there was one"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM UserPreferences WHERE user_id = ? AND movie_id = ?",
+                           (user_id, movie_id))
+            removed = cursor.rowcount > 0
+            conn.commit()
+        return removed
+
+    def get_preferences(self, user_id):
+        """A user's rated movies, most recent first"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT movie_id, movie_title, rating, is_favorite, watched_date FROM UserPreferences "
+                "WHERE user_id = ? ORDER BY watched_date DESC",
+                (user_id,)
+            )
+            rows = cursor.fetchall()
+        return [{'movie_id': r[0], 'movie_title': r[1], 'rating': r[2], 'is_favorite': bool(r[3]),
+                 'watched_date': str(r[4]) if r[4] is not None else None} for r in rows]
+
+    # --- Watchlist -------------------------------------------------------------
+    def add_to_watchlist(self, user_id, movie_id, movie_title=None):
+        """Add a movie to a user's watchlist (no-op if already there)"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL['add_watchlist'],
+                           self._add_watchlist_params(user_id, movie_id, movie_title))
+            conn.commit()
+
+    def remove_from_watchlist(self, user_id, movie_id):
+        """Remove a movie from a user's watchlist; True if it was there"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM Watchlist WHERE user_id = ? AND movie_id = ?",
+                           (user_id, movie_id))
+            removed = cursor.rowcount > 0
+            conn.commit()
+        return removed
+
+    def get_watchlist(self, user_id):
+        """A user's watchlist, most recently added first"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT movie_id, movie_title, watched, added_date FROM Watchlist "
+                "WHERE user_id = ? ORDER BY added_date DESC",
+                (user_id,)
+            )
+            rows = cursor.fetchall()
+        return [{'movie_id': r[0], 'movie_title': r[1], 'watched': bool(r[2]),
+                 'added_date': str(r[3]) if r[3] is not None else None} for r in rows]
+
+    # --- Activity --------------------------------------------------------------
+    def log_activity(self, user_id, activity_type, movie_title=None):
+        """Record one search/view/rate/favorite event"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO UserActivity (user_id, activity_type, movie_title) VALUES (?, ?, ?)",
+                (user_id, activity_type, movie_title)
+            )
+            conn.commit()
+
+    def log_activities(self, events):
+        """Insert many (user_id, activity_type, movie_title, timestamp) events
+        in one batched round trip"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            self._prepare_batch(cursor)
+            cursor.executemany(
+                "INSERT INTO UserActivity (user_id, activity_type, movie_title, activity_date) "
+                "VALUES (?, ?, ?, ?)",
+                [(user_id, activity_type, movie_title, self.db_datetime(timestamp))
+                 for user_id, activity_type, movie_title, timestamp in events]
+            )
+            conn.commit()
+
+    def _prepare_batch(self, cursor):
+        pass
+
+    def _begin(self, cursor):
+        pass
+
+    def db_datetime(self, timestamp):
+        """A Unix timestamp as this backend stores DATETIME values"""
+        return datetime.fromtimestamp(timestamp)
+
+    def _upsert_preference_params(self, user_id, movie_id, movie_title, rating, is_favorite):
+        return (user_id, movie_id, movie_title, rating, int(bool(is_favorite)))
+
+    def _add_watchlist_params(self, user_id, movie_id, movie_title):
+        return (user_id, movie_id, movie_title)
+
+    def _movie_id_column(self, cursor, table):
+        """'key' if `table` is keyed by movie id, 'column' if it only has the
+        column (partly migrated or VARCHAR), None if it has no movie_id"""
+        raise NotImplementedError
+
+    def _add_movie_id_column(self, cursor, table):
+        """Make sure `table` has a nullable integer movie_id column"""
+        raise NotImplementedError
+
+    def _rekey_table(self, cursor, table, key, date_column):
+        """Drop duplicate (user, movie) rows, keeping the most recent, then make
+        movie_id NOT NULL and unique per user. Returns the rows dropped."""
+        raise NotImplementedError
+
+class MSSQLUserStore(UserStore):
+    """SQL Server backend (pyodbc, Windows Authentication)"""
+
+    name = 'mssql'
+    SCHEMA = [
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Users' AND xtype='U')
+        CREATE TABLE Users (
+            user_id INT IDENTITY(1,1) PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at DATETIME DEFAULT GETDATE()
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='UserPreferences' AND xtype='U')
+        CREATE TABLE UserPreferences (
+            pref_id INT IDENTITY(1,1) PRIMARY KEY,
+            user_id INT FOREIGN KEY REFERENCES Users(user_id),
+            movie_id INT NOT NULL,
+            movie_title VARCHAR(500),
+            rating FLOAT,
+            watched_date DATETIME DEFAULT GETDATE(),
+            is_favorite BIT DEFAULT 0,
+            CONSTRAINT UQ_UserPreferences_User_Movie UNIQUE (user_id, movie_id)
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Watchlist' AND xtype='U')
+        CREATE TABLE Watchlist (
+            watchlist_id INT IDENTITY(1,1) PRIMARY KEY,
+            user_id INT FOREIGN KEY REFERENCES Users(user_id),
+            movie_id INT NOT NULL,
+            movie_title VARCHAR(500) NULL,
+            added_date DATETIME DEFAULT GETDATE(),
+            watched BIT DEFAULT 0,
+            CONSTRAINT UQ_Watchlist_User_Movie UNIQUE (user_id, movie_id)
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='UserActivity' AND xtype='U')
+        CREATE TABLE UserActivity (
+            activity_id INT IDENTITY(1,1) PRIMARY KEY,
+            user_id INT FOREIGN KEY REFERENCES Users(user_id),
+            activity_type VARCHAR(50) NOT NULL,
+            movie_title VARCHAR(500) NULL,
+            activity_date DATETIME DEFAULT GETDATE()
+        )
+        """
+    ]
+    SQL = {
+        'upsert_preference': """
+            UPDATE UserPreferences SET movie_title = ?, rating = ?, is_favorite = ?,
+                                       watched_date = GETDATE()
+            WHERE user_id = ? AND movie_id = ?;
+            IF @@ROWCOUNT = 0
+                INSERT INTO UserPreferences (user_id, movie_id, movie_title, rating, is_favorite)
+                VALUES (?, ?, ?, ?, ?);
+        """,
+        'add_watchlist': """
+            IF NOT EXISTS (SELECT 1 FROM Watchlist WHERE user_id = ? AND movie_id = ?)
+                INSERT INTO Watchlist (user_id, movie_id, movie_title) VALUES (?, ?, ?);
+        """,
+        'merge_preferences': """
+            MERGE UserPreferences AS target
+            USING (VALUES {values}) AS source (user_id, movie_id, movie_title, rating, is_favorite)
+            ON target.user_id = source.user_id AND target.movie_id = source.movie_id
+            WHEN MATCHED THEN
+                UPDATE SET movie_title = source.movie_title, rating = source.rating,
+                           is_favorite = source.is_favorite, watched_date = GETDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (user_id, movie_id, movie_title, rating, is_favorite)
+                VALUES (source.user_id, source.movie_id, source.movie_title, source.rating,
+                        source.is_favorite);
+        """,
+        'add_movie_id': """
+            IF COL_LENGTH('{table}', 'movie_id') IS NULL
+                ALTER TABLE {table} ADD movie_id INT NULL;
+            ELSE
+            BEGIN
+                -- setup_database.sql created an unused VARCHAR(50) movie_id
+                EXEC('UPDATE {table} SET movie_id = NULL WHERE TRY_CAST(movie_id AS INT) IS NULL');
+                EXEC('ALTER TABLE {table} ALTER COLUMN movie_id INT NULL');
+            END
+        """,
+        'dedupe_movie_ids': """
+            WITH ranked AS (
+                SELECT ROW_NUMBER() OVER (PARTITION BY user_id, movie_id
+                                          ORDER BY {date_column} DESC, {key} DESC) AS row_number
+                FROM {table}
+            )
+            DELETE FROM ranked WHERE row_number > 1
+        """
+    }
+    MERGE_ROWS = 400  # 5 parameters per row stays under SQL Server's 2100 limit
+
+    def __init__(self):
+        super().__init__(get_db_connection)
+        self.integrity_errors = (pyodbc.IntegrityError,) if pyodbc is not None else ()
+
+    def _upsert_preference_params(self, user_id, movie_id, movie_title, rating, is_favorite):
+        is_favorite = int(bool(is_favorite))
+        return (movie_title, rating, is_favorite, user_id, movie_id,
+                user_id, movie_id, movie_title, rating, is_favorite)
+
+    def _add_watchlist_params(self, user_id, movie_id, movie_title):
+        return (user_id, movie_id, user_id, movie_id, movie_title)
+
+    def _movie_id_column(self, cursor, table):
+        cursor.execute("SELECT DATA_TYPE, IS_NULLABLE FROM INFORMATION_SCHEMA.COLUMNS "
+                       "WHERE TABLE_NAME = ? AND COLUMN_NAME = 'movie_id'", (table,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return 'key' if row[0].lower() == 'int' and row[1] == 'NO' else 'column'
+
+    def _add_movie_id_column(self, cursor, table):
+        cursor.execute(self.SQL['add_movie_id'].format(table=table))
+
+    def _rekey_table(self, cursor, table, key, date_column):
+        cursor.execute(self.SQL['dedupe_movie_ids'].format(table=table, key=key,
+                                                           date_column=date_column))
+        duplicates = max(cursor.rowcount, 0)
+        # The title index has to go before the column it covers can be altered
+        cursor.execute(f"IF EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_{table}_MovieTitle') "
+                       f"DROP INDEX IX_{table}_MovieTitle ON {table}")
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN movie_id INT NOT NULL")
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN movie_title VARCHAR(500) NULL")
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT UQ_{table}_User_Movie "
+                       "UNIQUE (user_id, movie_id)")
+        return duplicates
+
+    def _prepare_batch(self, cursor):
+        # Send the whole parameter array in one round trip instead of one per row
+        cursor.fast_executemany = True
+
+    def add_preferences(self, user_id, items):
+        # The UPDATE / IF @@ROWCOUNT upsert is a multi-statement batch, which
+        # executemany can't send in bulk; a MERGE over a VALUES list can
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(items), self.MERGE_ROWS):
+                chunk = items[start:start + self.MERGE_ROWS]
+                values = ', '.join(['(?, ?, ?, ?, ?)'] * len(chunk))
+                params = [value for movie_id, movie_title, rating, is_favorite in chunk
+                          for value in (user_id, movie_id, movie_title, rating,
+                                        int(bool(is_favorite)))]
+                cursor.execute(self.SQL['merge_preferences'].format(values=values), params)
+            conn.commit()
+
+class SQLiteUserStore(UserStore):
+    """SQLite backend in WAL mode, for local runs and load tests on Linux"""
+
+    name = 'sqlite'
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS Users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS UserPreferences (
+            pref_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES Users(user_id) ON DELETE CASCADE,
+            movie_id INTEGER NOT NULL,
+            movie_title TEXT,
+            rating REAL,
+            watched_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            is_favorite INTEGER DEFAULT 0,
+            UNIQUE (user_id, movie_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Watchlist (
+            watchlist_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES Users(user_id) ON DELETE CASCADE,
+            movie_id INTEGER NOT NULL,
+            movie_title TEXT,
+            added_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            watched INTEGER DEFAULT 0,
+            UNIQUE (user_id, movie_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS UserActivity (
+            activity_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES Users(user_id) ON DELETE CASCADE,
+            activity_type TEXT NOT NULL,
+            movie_title TEXT,
+            activity_date TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS IX_UserActivity_UserId ON UserActivity(user_id)"
+    ]
+    SQL = {
+        'upsert_preference': """
+            INSERT INTO UserPreferences (user_id, movie_id, movie_title, rating, is_favorite)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, movie_id) DO UPDATE SET
+                movie_title = excluded.movie_title,
+                rating = excluded.rating,
+                is_favorite = excluded.is_favorite,
+                watched_date = CURRENT_TIMESTAMP
+        """,
+        'add_watchlist': "INSERT OR IGNORE INTO Watchlist (user_id, movie_id, movie_title) "
+                         "VALUES (?, ?, ?)"
+    }
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self):
+        super().__init__(get_sqlite_connection)
+
+    def db_datetime(self, timestamp):
+        # Same UTC text format as CURRENT_TIMESTAMP
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    def _begin(self, cursor):
+        # The sqlite3 module only opens transactions implicitly before DML, so
+        # the ALTER / CREATE TABLE steps of a migration would autocommit
+        cursor.execute("BEGIN")
+
+    def _movie_id_column(self, cursor, table):
+        cursor.execute(f"PRAGMA table_info({table})")
+        for _, name, _, notnull, _, _ in cursor.fetchall():
+            if name == 'movie_id':
+                return 'key' if notnull else 'column'
+        return None
+
+    def _add_movie_id_column(self, cursor, table):
+        if self._movie_id_column(cursor, table) is None:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN movie_id INTEGER")
+
+    def _rekey_table(self, cursor, table, key, date_column):
+        # SQLite can't add constraints in place: copy the newest row of each
+        # (user, movie) into a table built from the current schema and swap it in
+        schema = next(statement for statement in self.SCHEMA
+                      if f"CREATE TABLE IF NOT EXISTS {table} (" in statement)
+        cursor.execute(schema.replace(f"CREATE TABLE IF NOT EXISTS {table} (",
+                                      f"CREATE TABLE {table}_rekeyed ("))
+        cursor.execute(f"PRAGMA table_info({table}_rekeyed)")
+        columns = ', '.join(row[1] for row in cursor.fetchall())
+        cursor.execute(f"""
+            INSERT INTO {table}_rekeyed ({columns})
+            SELECT {columns} FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id, movie_id
+                                             ORDER BY {date_column} DESC, {key} DESC) AS row_number
+                FROM {table}
+            ) WHERE row_number = 1
+        """)
+        kept = cursor.rowcount
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        duplicates = cursor.fetchone()[0] - kept
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_rekeyed RENAME TO {table}")
+        return duplicates
+
+STORAGE_BACKENDS = {
+    MSSQLUserStore.name: MSSQLUserStore,
+    SQLiteUserStore.name: SQLiteUserStore,
+}
+
+def create_store(backend=STORAGE_BACKEND):
+    """Instantiate the configured storage backend"""
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}' (choose from {', '.join(STORAGE_BACKENDS)})")
+    return STORAGE_BACKENDS[backend]()
+
+store = create_store()
+
+# ============================================================================
+# User Data Cache
+# ============================================================================
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300  # Bounds staleness from writes made in other workers
+
+class UserDataCache:
+    """Per-user write-through cache of watchlists and preferences
+
+    Reads load a user's list once and then serve it from memory. Writes go
+    to the database first and are then applied to the cached list, so users
+    read their own writes without another query. A load that raced with a
+    write is discarded instead of overwriting the newer list: writes are
+    counted only while a load of that list is in flight, so the counters
+    never outlive the loads that need them.
+    """
+
+    def __init__(self, max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user_id, kind) -> (loaded_at, items)
+        self._pending = {}             # (user_id, kind) -> [writes, loads in flight]
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def peek(self, user_id, kind):
+        """(cached items or None, write counter to pass to put()); every miss
+        must be followed by put(), with items=None if the load failed"""
+        key = (user_id, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return [dict(item) for item in entry[1]], None
+            self._stats['misses'] += 1
+            pending = self._pending.setdefault(key, [0, 0])
+            pending[1] += 1
+            return None, pending[0]
+
+    def put(self, user_id, kind, items, writes):
+        """Cache freshly loaded items unless a write happened since peek()"""
+        key = (user_id, kind)
+        with self._lock:
+            pending = self._pending[key]
+            pending[1] -= 1
+            if not pending[1]:
+                del self._pending[key]
+            if items is None or pending[0] != writes:
+                return
+            self._entries[key] = (time.monotonic(), [dict(item) for item in items])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def update(self, user_id, kind, apply):
+        """Apply a write to the cached list with `apply(items) -> items`"""
+        key = (user_id, kind)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending[0] += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], apply(entry[1]))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+user_cache = UserDataCache()
+USER_DATA_LOADERS = {'watchlist': 'get_watchlist', 'preferences': 'get_preferences'}
+
+def user_data(user_id, kind):
+    """A user's watchlist or preferences, through the write-through cache"""
+    items, writes = user_cache.peek(user_id, kind)
+    if items is None:
+        try:
+            items = getattr(store, USER_DATA_LOADERS[kind])(user_id)
+        finally:
+            user_cache.put(user_id, kind, items, writes)
+    return items
+
+def cache_upsert_preferences(user_id, items):
+    """Write-through for rating upserts: each rated movie moves to the front"""
+    now = str(store.db_datetime(time.time()))
+    def apply(cached):
+        ids = {movie_id for movie_id, _, _, _ in items}
+        fresh = [{'movie_id': movie_id, 'movie_title': movie_title, 'rating': rating,
+                  'is_favorite': bool(is_favorite), 'watched_date': now}
+                 for movie_id, movie_title, rating, is_favorite in reversed(items)]
+        return fresh + [item for item in cached if item['movie_id'] not in ids]
+    user_cache.update(user_id, 'preferences', apply)
+
+def cache_remove(user_id, kind, movie_id):
+    """Write-through for deletes from a watchlist or preference list"""
+    user_cache.update(user_id, kind,
+                      lambda cached: [item for item in cached if item['movie_id'] != movie_id])
+
+def cache_add_to_watchlist(user_id, movie_id, movie_title):
+    """Write-through for watchlist additions (no-op if already listed)"""
+    now = str(store.db_datetime(time.time()))
+    def apply(cached):
+        if any(item['movie_id'] == movie_id for item in cached):
+            return cached
+        return [{'movie_id': movie_id, 'movie_title': movie_title, 'watched': False,
+                 'added_date': now}] + cached
+    user_cache.update(user_id, 'watchlist', apply)
+
+# ============================================================================
+# User Activity Log
+# ============================================================================
+ACTIVITY_CONFIG = {
+    'batch_size': int(os.environ.get('MOVIERECOMM_ACTIVITY_BATCH', 500)),     # Flush every N events...
+    'flush_interval': float(os.environ.get('MOVIERECOMM_ACTIVITY_FLUSH_MS', 250)) / 1000,  # ...or T ms
+    'max_queue': int(os.environ.get('MOVIERECOMM_ACTIVITY_QUEUE', 50000)),    # Newer events are dropped beyond this
+    'max_retries': 3,
+    'shutdown_timeout': 5.0
+}
+
+class ActivityLog:
+    """Buffered writer for UserActivity events
+
+    Request handlers call record(), which only appends to an in-memory
+    queue and never waits on the database. A background thread writes the
+    queue in batches with a single executemany per batch, retrying with
+    backoff when the database is slow or down. When the queue is full, new
+    events are dropped and counted rather than slowing requests down.
+    """
+
+    def __init__(self, store, batch_size=500, flush_interval=0.25, max_queue=50000,
+                 max_retries=3, shutdown_timeout=5.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.shutdown_timeout = shutdown_timeout
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'failed': 0,
+                       'batches': 0, 'retries': 0}
+        self._last_error = None
+
+    def record(self, user_id, activity_type, movie_title=None):
+        """Queue one event without blocking; returns False if it was dropped"""
+        event = (user_id, activity_type, movie_title[:500] if movie_title else movie_title, time.time())
+        with self._cond:
+            if self._closed or len(self._events) >= self.max_queue:
+                self._stats['dropped'] += 1
+                return False
+            self._events.append(event)
+            self._stats['recorded'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='activity-log', daemon=True)
+                self._thread.start()
+            if len(self._events) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._events) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._events:
+                    if self._closed:
+                        return
+                    continue
+                batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+            self._write(batch)
+
+    def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.store.log_activities(batch)
+                with self._cond:
+                    self._stats['written'] += len(batch)
+                    self._stats['batches'] += 1
+                return
+            except Exception as e:
+                with self._cond:
+                    self._last_error = str(e)
+                    if attempt < self.max_retries:
+                        self._stats['retries'] += 1
+                if attempt < self.max_retries and not self._closed:
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        
+        with self._cond:
+            self._stats['failed'] += len(batch)
+        print(f"✗ Dropped {len(batch)} activity events after {self.max_retries} retries: {self._last_error}")
+
+    def close(self):
+        """Flush queued events and stop the writer (called at exit)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(self.shutdown_timeout)
+        with self._cond:
+            if self._events:
+                self._stats['dropped'] += len(self._events)
+                print(f"✗ Activity log shut down with {len(self._events)} unwritten events")
+                self._events.clear()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, queued=len(self._events), max_queue=self.max_queue,
+                        last_error=self._last_error)
+
+activity_log = ActivityLog(store, **ACTIVITY_CONFIG)
+atexit.register(activity_log.close)
+
+# ============================================================================
+# Database Initialization
+# ============================================================================
+def init_database():
+    """Initialize database tables"""
+    try:
+        store.init_schema()
+        print(f"✓ Database tables initialized successfully ({store.name})")
+        if not store.movie_ids_migrated():
+            print("✗ UserPreferences/Watchlist are still keyed by title - run migrate_movie_ids.py")
+    except Exception as e:
+        print(f"✗ Database initialization error: {e}")
+
+# ============================================================================
+# Helper Functions
+# ============================================================================
+def hash_password(password):
+    """Hash password using SHA256"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+# ============================================================================
+# Movie Data Loading
+# ============================================================================
+MOVIES_CSV_PATH = 'movies.csv'
+TFIDF_PARAMS = {'stop_words': 'english', 'max_features': 5000}
+
+def read_movies_csv(path=MOVIES_CSV_PATH):
+    """Parse movies.csv and fill in the columns the app relies on"""
+    df = pd.read_csv(path, encoding='utf-8')
+    
+    print(f"Loaded {len(df)} movies from dataset")
+    print(f"Columns: {list(df.columns)}")
+    
+    return clean_movies(df)
+
+def clean_movies(df):
+    """Ensure the title/overview/genres columns exist and hold no NaNs"""
+    # Ensure required columns exist
+    if 'title' not in df.columns:
+        df['title'] = df.iloc[:, 0]
+    
+    if 'overview' not in df.columns:
+        df['overview'] = ''
+    
+    if 'genres' not in df.columns:
+        df['genres'] = ''
+    
+    # Clean data
+    df['overview'] = df['overview'].fillna('')
+    df['genres'] = df['genres'].fillna('')
+    df['title'] = df['title'].fillna('Unknown')
+    return df
+
+def combined_text(df):
+    """The text each movie is vectorised from: title + overview + genres"""
+    def text(column):
+        return df[column].astype(object).fillna('').astype(str)
+    return text('title') + ' ' + text('overview') + ' ' + text('genres')
+
+def fit_tfidf(df):
+    """Fit the TF-IDF model on title + overview + genres"""
+    combined_features = combined_text(df)
+    
+    # Rows are L2-normalised, so a sparse dot product is the cosine
+    # similarity - no dense N x N matrix is ever materialised.
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    matrix = vectorizer.fit_transform(combined_features).tocsr()
+    return vectorizer, matrix
+
+MISSING_DAY = np.iinfo(np.int32).min  # release_day of undated movies
+CATEGORICAL_COLUMNS = ['original_language', 'genres']
+FLOAT32_COLUMNS = ['popularity', 'vote_average']
+INT32_COLUMNS = ['id', 'vote_count']
+INTERNED_COLUMNS = ['title', 'original_title', 'overview']
+
+def to_day_numbers(dates):
+    """Date strings -> int32 days since 1970-01-01 (MISSING_DAY if unparseable)"""
+    parsed = pd.to_datetime(pd.Series(dates), errors='coerce', format='%Y-%m-%d')
+    days = (parsed - pd.Timestamp('1970-01-01')).dt.days
+    return days.fillna(MISSING_DAY).to_numpy(dtype=np.int32)
+
+def from_day_numbers(days, missing='N/A'):
+    """int32 day numbers -> 'YYYY-MM-DD' strings (object array)"""
+    days = np.asarray(days)
+    out = np.full(len(days), missing, dtype=object)
+    valid = days != MISSING_DAY
+    out[valid] = np.datetime_as_string(days[valid].astype('datetime64[D]'))
+    return out
+
+def compact_movie_table(df):
+    """Shrink the movie table: categoricals, bool, float32/int32 numerics,
+    int32 release days and interned strings"""
+    df = df.copy()
+    
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(object).astype('category')
+    
+    if 'adult' in df.columns:
+        df['adult'] = df['adult'].astype(str).str.lower().isin(['true', '1'])
+    
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(np.float32)
+    
+    for column in INT32_COLUMNS:
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors='coerce')
+            if values.notna().all() and values.abs().max() < np.iinfo(np.int32).max:
+                df[column] = values.astype(np.int32)
+    
+    if 'release_date' in df.columns:
+        df['release_day'] = to_day_numbers(df['release_date'])
+        df = df.drop(columns='release_date')
+    
+    # Interning makes repeated strings (e.g. original_title == title) share one object
+    for column in INTERNED_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.Series([sys.intern(v) if isinstance(v, str) else v
+                                    for v in df[column].tolist()], index=df.index, dtype=object)
+    return df
+
+def build_model_from_disk():
+    """Build a ModelSnapshot from movies.csv (or its artifact cache) and the neighbor index"""
+    # Fingerprint the inputs before reading them, so a change that lands
+    # mid-build is still picked up by the watcher
+    source = source_signature()
+    
+    # Reuse the fitted model from the artifact cache when movies.csv is unchanged
+    cache_key = artifact_cache_key(MOVIES_CSV_PATH)
+    artifacts = load_artifacts(cache_key)
+    
+    if artifacts is None:
+        drift = dict(NO_VOCABULARY_DRIFT)  # Fresh fit
+        df = read_movies_csv(MOVIES_CSV_PATH)
+        
+        # Create TF-IDF matrix for content-based recommendations
+        vectorizer, matrix = fit_tfidf(df)
+        
+        # Inverted index for /api/search
+        search = SearchIndex.build(df)
+        
+        # Compact dtypes once the text has been vectorised
+        df = compact_movie_table(df)
+        
+        save_artifacts(cache_key, df, vectorizer, matrix, search, drift)
+    else:
+        df, vectorizer, matrix, search, drift = artifacts
+    
+    print(f"  Movie table: {df.memory_usage(deep=True).sum() / 1024 / 1024:.2f} MB")
+    
+    engine = create_engine(matrix, cache_key=cache_key)
+    
+    # Shared top-K neighbor index (built offline by build_neighbor_index.py).
+    # It holds TF-IDF cosine neighbors, so engines with their own similarity
+    # space answer every query themselves
+    if engine.tfidf_space:
+        ids, scores = load_neighbor_index(df, vectorizer)
+    else:
+        ids, scores = None, None
+        print(f"  Neighbor index not used by the {engine.name} engine")
+    
+    # The version also changes when only the neighbor index was rebuilt
+    data_key = hashlib.sha256(f"{cache_key}{source[1]}".encode()).hexdigest()
+    return ModelSnapshot(df, vectorizer, matrix, search, ids, scores,
+                         data_key=data_key, source=source, drift=drift, engine=engine)
+
+def load_movies_data():
+    """Load and prepare movie dataset from Kaggle"""
+    try:
+        with model_write_lock:
+            publish_model(build_model_from_disk())
+        
+        print("✓ Movie recommendation engine initialized successfully!")
+        
+    except FileNotFoundError:
+        print("✗ ERROR: movies.csv not found!")
+        print("   Please download from: https://www.kaggle.com/datasets/amitksingh2103/trending-movies-over-the-years")
+    except Exception as e:
+        print(f"✗ Error loading movies: {e}")
+
+# ============================================================================
+# Model Snapshot & Hot Reload
+# ============================================================================
+MODEL_WATCH_INTERVAL = float(os.environ.get('MOVIERECOMM_WATCH_INTERVAL', 5))  # 0 disables
+MODEL_GRACE_SECONDS = 60  # Retired snapshots stay referenced this long
+
+class ModelSnapshot:
+    """Immutable bundle of one catalog version and everything derived from it
+
+    Request handlers take a reference once with current_model() and use only
+    that object, so a reload can never hand them a new table with an old
+    matrix. Reloads build a complete new snapshot and swap the reference.
+    """
+
+    __slots__ = ('df', 'vectorizer', 'tfidf_matrix', 'search_index', 'neighbor_ids',
+                 'neighbor_scores', 'title_index', 'movie_id_index', 'columns',
+                 'popularity_orders', 'priors', 'facets', 'browser', 'engine', 'version', 'source',
+                 'vocabulary_drift', 'created_at')
+
+    def __init__(self, df, vectorizer, matrix, search, neighbor_ids, neighbor_scores,
+                 data_key, source=None, drift=None, engine=None):
+        facets = FacetIndex(df)
+        signals = ranking_signals(df)
+        popularity_orders = build_popularity_orders(df, signals)
+        values = {
+            'df': df,
+            'vectorizer': vectorizer,
+            'tfidf_matrix': matrix,
+            'search_index': search,
+            'neighbor_ids': neighbor_ids,
+            'neighbor_scores': neighbor_scores,
+            # Lookup tables so requests never scan the title column
+            'title_index': build_title_index(df),
+            'movie_id_index': MovieIdIndex(df['id'] if 'id' in df.columns else []),
+            # Cleaned, API-ready columns for serialize()
+            'columns': build_movie_columns(df),
+            # Precomputed rankings for /api/popular
+            'popularity_orders': popularity_orders,
+            # Rating / popularity / recency signals for hybrid re-ranking
+            'priors': build_ranking_priors(df, signals),
+            # Filter bitsets, and the sort orders of /api/movies
+            'facets': facets,
+            'browser': CatalogBrowser(df, facets, popularity_orders, signals),
+            # Fallback similarity search when the neighbor index can't answer
+            'engine': engine or create_engine(matrix),
+            # Same data -> same version in every worker
+            'version': f"{data_key[:16]}-{len(df)}",
+            'source': source,
+            # Ingested tokens vs. unknown ones since the vectoriser was fitted
+            'vocabulary_drift': dict(drift or NO_VOCABULARY_DRIFT),
+            'created_at': time.time(),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ModelSnapshot is immutable; build a new one and publish it")
+
+    def __len__(self):
+        return len(self.df)
+
+current_snapshot = None
+model_write_lock = threading.Lock()  # Serialises rebuilds and ingestion, never taken by readers
+retired_snapshots = deque()          # (retired_at, snapshot)
+reload_state = {'running': False, 'pending': False, 'reloads': 0,
+                'last_reload': None, 'last_error': None}
+reload_state_lock = threading.Lock()
+
+def current_model():
+    """The live ModelSnapshot (None until the first load); take it once per request"""
+    return current_snapshot
+
+def publish_model(snapshot):
+    """Atomically make `snapshot` the live model"""
+    global current_snapshot
+    previous, current_snapshot = current_snapshot, snapshot
+    response_cache.clear()  # Entries are keyed by version, so this only frees memory
+    
+    # Requests that started on the previous snapshot keep their own
+    # reference; holding it for a grace period as well keeps its memory maps
+    # and buffers alive for any stragglers before it is released
+    now = time.monotonic()
+    if previous is not None:
+        retired_snapshots.append((now, previous))
+    while retired_snapshots and now - retired_snapshots[0][0] > MODEL_GRACE_SECONDS:
+        retired_snapshots.popleft()
+
+def source_signature():
+    """(mtime, size) of the files a model is built from"""
+    signature = []
+    for path in (MOVIES_CSV_PATH, NEIGHBOR_INDEX_PATH):
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+def reload_model_async(reason, only_if_changed=False):
+    """Rebuild the model on a background thread; returns False if one is already
+    running (a follow-up rebuild is queued instead)"""
+    with reload_state_lock:
+        if reload_state['running']:
+            reload_state['pending'] = True
+            return False
+        reload_state['running'] = True
+    
+    threading.Thread(target=_reload_worker, args=(reason, only_if_changed),
+                     name='model-reload', daemon=True).start()
+    return True
+
+def _reload_worker(reason, only_if_changed):
+    while True:
+        try:
+            with model_write_lock:
+                # Ingestion rewrites the source files and publishes its own
+                # snapshot, which the watcher may have seen half-way through
+                model = current_model()
+                if only_if_changed and model is not None and source_signature() == model.source:
+                    snapshot = None
+                else:
+                    print(f"\n=== MODEL RELOAD ({reason}) ===")
+                    snapshot = build_model_from_disk()
+                    publish_model(snapshot)
+            if snapshot is not None:
+                with reload_state_lock:
+                    reload_state['reloads'] += 1
+                    reload_state['last_reload'] = time.time()
+                    reload_state['last_error'] = None
+                print(f"✓ Model reloaded: version {snapshot.version} ({len(snapshot)} movies)")
+        except Exception as e:
+            with reload_state_lock:
+                reload_state['last_error'] = str(e)
+            print(f"✗ Model reload failed, keeping the current model: {e}")
+        
+        with reload_state_lock:
+            if not reload_state['pending']:
+                reload_state['running'] = False
+                return
+            reload_state['pending'] = False
+            reason, only_if_changed = 'queued', False
+
+def start_model_watcher(interval=MODEL_WATCH_INTERVAL):
+    """Poll movies.csv and the neighbor index, reloading when either changes"""
+    if interval <= 0:
+        return None
+    
+    def watch():
+        while True:
+            time.sleep(interval)
+            model = current_model()
+            if model is None or reload_state['running']:
+                continue
+            if source_signature() != model.source:
+                reload_model_async('source files changed', only_if_changed=True)
+    
+    watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+    watcher.start()
+    print(f"✓ Watching {MOVIES_CSV_PATH} and {NEIGHBOR_INDEX_PATH} for changes (every {interval:g}s)")
+    return watcher
+
+# ============================================================================
+# Startup Artifact Cache
+# ============================================================================
+# Bump when the on-disk layout or anything baked into the artifacts changes
+ARTIFACT_CACHE_VERSION = 2
+ARTIFACT_CACHE_DIR = os.environ.get('MOVIERECOMM_CACHE_DIR', '.cache')
+
+def artifact_cache_key(csv_path):
+    """Hash of the CSV contents, the model parameters and the cache version"""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    
+    key = {
+        'version': ARTIFACT_CACHE_VERSION,
+        'csv_sha256': digest.hexdigest(),
+        'tfidf': TFIDF_PARAMS,
+        'search': {'fields': SEARCH_FIELDS, 'token_pattern': SEARCH_TOKEN_PATTERN},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+
+def _pack_strings(values):
+    """Arrow-style UTF-8 buffer + offsets (+ null mask) for a string column"""
+    is_null = pd.isna(values)
+    encoded = [b'' if null else str(v).encode('utf-8') for v, null in zip(values, is_null)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, np.asarray(is_null)
+
+def _unpack_strings(data, offsets, is_null):
+    buffer = data.tobytes()
+    return [None if null else buffer[start:stop].decode('utf-8')
+            for start, stop, null in zip(offsets[:-1].tolist(), offsets[1:].tolist(), is_null.tolist())]
+
+def save_movie_table(path, df):
+    """Store the movie table column by column in an .npz (no pickling)
+
+    Returns the column list with each column's storage kind for the cache
+    metadata.
+    """
+    arrays = {}
+    layout = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            kind = 'category'
+            arrays[f'c{i}_codes'] = values.cat.codes.to_numpy()
+            data, offsets, is_null = _pack_strings(values.cat.categories.tolist())
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            kind = 'values'
+            arrays[f'c{i}_values'] = values.to_numpy()
+            data = None
+        else:
+            kind = 'string'
+            data, offsets, is_null = _pack_strings(values.tolist())
+        if data is not None:
+            arrays[f'c{i}_data'], arrays[f'c{i}_offsets'], arrays[f'c{i}_null'] = data, offsets, is_null
+        layout.append([column, kind])
+    np.savez(path, **arrays)
+    return layout
+
+def load_movie_table(path, layout):
+    """Inverse of save_movie_table()"""
+    with np.load(path, allow_pickle=False) as arrays:
+        data = {}
+        for i, (column, kind) in enumerate(layout):
+            if kind == 'values':
+                data[column] = arrays[f'c{i}_values']
+                continue
+            strings = _unpack_strings(arrays[f'c{i}_data'], arrays[f'c{i}_offsets'], arrays[f'c{i}_null'])
+            if kind == 'category':
+                data[column] = pd.Categorical.from_codes(arrays[f'c{i}_codes'], categories=strings)
+            else:
+                data[column] = pd.Series([sys.intern(v) if v is not None else v for v in strings],
+                                         dtype=object)
+    return pd.DataFrame(data, columns=[column for column, _ in layout])
+
+def save_artifacts(cache_key, df, vectorizer, matrix, search, drift=None):
+    """Write the fitted model, matrix, search index and movie table to the cache,
+    with the vocabulary drift accumulated against the vectoriser in meta.json"""
+    final_dir = os.path.join(ARTIFACT_CACHE_DIR, cache_key)
+    if os.path.isdir(final_dir):
+        return
+    
+    try:
+        os.makedirs(ARTIFACT_CACHE_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f'{cache_key}.', dir=ARTIFACT_CACHE_DIR)
+        
+        with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump({term: int(i) for term, i in vectorizer.vocabulary_.items()}, f)
+        np.save(os.path.join(tmp_dir, 'idf.npy'), vectorizer.idf_)
+        scipy.sparse.save_npz(os.path.join(tmp_dir, 'tfidf.npz'), matrix, compressed=False)
+        columns = save_movie_table(os.path.join(tmp_dir, 'movies.npz'), df)
+        search.save(tmp_dir)
+        
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': ARTIFACT_CACHE_VERSION, 'key': cache_key,
+                       'n_movies': len(df), 'columns': columns,
+                       'vocabulary_drift': dict(drift or NO_VOCABULARY_DRIFT)}, f)
+        
+        # Publish atomically; another worker may have won the race
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        # Drop artifacts for older versions of the data
+        for entry in os.listdir(ARTIFACT_CACHE_DIR):
+            if entry != cache_key and '.' not in entry:
+                shutil.rmtree(os.path.join(ARTIFACT_CACHE_DIR, entry), ignore_errors=True)
+        print(f"✓ Artifact cache written: {final_dir}")
+    except Exception as e:
+        print(f"✗ Could not write artifact cache: {e}")
+
+def load_artifacts(cache_key):
+    """(movies_df, vectorizer, tfidf_matrix, search_index, vocabulary_drift)
+    from the cache, or None"""
+    cache_dir = os.path.join(ARTIFACT_CACHE_DIR, cache_key)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != ARTIFACT_CACHE_VERSION or meta.get('key') != cache_key:
+            return None
+        
+        vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+        with open(os.path.join(cache_dir, 'vocabulary.json'), encoding='utf-8') as f:
+            vectorizer.vocabulary_ = json.load(f)
+        vectorizer.idf_ = np.load(os.path.join(cache_dir, 'idf.npy'))
+        
+        matrix = scipy.sparse.load_npz(os.path.join(cache_dir, 'tfidf.npz')).tocsr()
+        df = load_movie_table(os.path.join(cache_dir, 'movies.npz'), meta['columns'])
+        search = SearchIndex.load(cache_dir)
+        
+        drift = dict(NO_VOCABULARY_DRIFT, **meta.get('vocabulary_drift', {}))
+        
+        print(f"Loaded {len(df)} movies from artifact cache ({cache_dir})")
+        return df, vectorizer, matrix, search, drift
+    except Exception as e:
+        print(f"✗ Ignoring unreadable artifact cache {cache_dir}: {e}")
+        return None
+
+# ============================================================================
+# Catalog Ingestion
+# ============================================================================
+# Refit from scratch once this share of ingested tokens is missing from the
+# fitted vocabulary
+VOCABULARY_DRIFT_THRESHOLD = 0.25
+VOCABULARY_DRIFT_MIN_TOKENS = 1000  # Don't judge drift on a handful of words
+MAX_INGEST_ROWS = 5000
+
+# Drift is counted per fitted vectoriser: it travels with the snapshot and
+# the artifact cache, and only starts over when fit_tfidf() runs
+NO_VOCABULARY_DRIFT = {'tokens': 0, 'unknown_tokens': 0, 'ingested_movies': 0}
+
+def append_movie_rows(df, new_rows):
+    """Concatenate two compact movie tables, keeping categoricals and int32 columns"""
+    new_rows = new_rows.reindex(columns=df.columns)
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            categories = df[column].cat.categories.union(
+                pd.Index(new_rows[column].dropna().astype(object).unique()), sort=False)
+            df = df.assign(**{column: df[column].cat.set_categories(categories)})
+            new_rows[column] = pd.Categorical(new_rows[column].astype(object), categories=categories)
+    
+    combined = pd.concat([df, new_rows], ignore_index=True)
+    for column in df.columns:
+        if combined[column].dtype != df[column].dtype and combined[column].notna().all():
+            try:
+                combined[column] = combined[column].astype(df[column].dtype)
+            except (TypeError, ValueError):
+                pass
+    return combined
+
+def ingest_movies(records, persist=True):
+    """Append new movies to the live catalog without refitting the model
+
+    New rows are transformed with the fitted vectoriser and stacked under
+    the existing TF-IDF matrix; the neighbor index keeps serving the old
+    rows and similar_movies() merges the new ones in. When too many of the
+    ingested tokens are unknown to the vocabulary, the whole model is refit
+    instead. The result is published as a new snapshot. Returns a summary dict.
+    """
+    with model_write_lock:
+        model = current_model()
+        if model is None:
+            raise RuntimeError("Movie data not loaded")
+        
+        raw = pd.DataFrame.from_records(records)
+        if raw.empty:
+            return {'added': 0, 'total': len(model), 'refit': False}
+        if 'title' not in raw.columns or raw['title'].isna().any():
+            raise ValueError("Every movie needs a title")
+        
+        # Movies are addressed by id, so each one needs a new, unique id
+        ids = [record.get('id') for record in records]
+        if not all(isinstance(movie_id, (int, np.integer)) and not isinstance(movie_id, bool) and
+                   0 <= movie_id <= np.iinfo(np.int32).max for movie_id in ids):
+            raise ValueError("Every movie needs an integer id (0 to 2147483647)")
+        if len(set(ids)) < len(ids):
+            raise ValueError("Movie ids must be unique within the batch")
+        taken = [movie_id for movie_id, pos in zip(ids, model.movie_id_index.lookup(ids)) if pos >= 0]
+        if taken:
+            raise ValueError(f"Movie ids already in the catalog: {', '.join(map(str, taken[:10]))}")
+        
+        # Same columns as the CSV, with numeric gaps filled so the compact
+        # dtypes of the live table are preserved
+        csv_columns = pd.read_csv(MOVIES_CSV_PATH, nrows=0).columns.tolist()
+        raw = clean_movies(raw.reindex(columns=csv_columns + [c for c in raw.columns if c not in csv_columns]))
+        for column in FLOAT32_COLUMNS + INT32_COLUMNS:
+            if column in raw.columns and column != 'id':
+                raw[column] = pd.to_numeric(raw[column], errors='coerce').fillna(0)
+        
+        # Vocabulary drift of the new text against the fitted model
+        analyzer = model.vectorizer.build_analyzer()
+        tokens = [token for text in combined_text(raw) for token in analyzer(text)]
+        unknown = sum(1 for token in tokens if token not in model.vectorizer.vocabulary_)
+        counts = model.vocabulary_drift
+        counts = {'tokens': counts['tokens'] + len(tokens),
+                  'unknown_tokens': counts['unknown_tokens'] + unknown,
+                  'ingested_movies': counts['ingested_movies'] + len(raw)}
+        drift = counts['unknown_tokens'] / max(counts['tokens'], 1)
+        
+        df = append_movie_rows(model.df, compact_movie_table(raw))
+        refit = (counts['tokens'] >= VOCABULARY_DRIFT_MIN_TOKENS and
+                 drift > VOCABULARY_DRIFT_THRESHOLD)
+        if refit:
+            vectorizer, matrix = fit_tfidf(df)
+            counts = dict(NO_VOCABULARY_DRIFT)
+            ids, scores = None, None  # Every neighbor list may have changed
+        else:
+            vectorizer = model.vectorizer
+            matrix = scipy.sparse.vstack([model.tfidf_matrix, vectorizer.transform(combined_text(raw))],
+                                         format='csr')
+            ids, scores = model.neighbor_ids, model.neighbor_scores
+        search = SearchIndex.build(df)
+        
+        if persist:
+            data_key = persist_ingested_movies(raw, df, vectorizer, matrix, search, counts)
+            if refit:
+                discard_neighbor_index()
+            source = source_signature()  # Our own write is not a reason to reload
+        else:
+            data_key = hashlib.sha256(f"{model.version}+{len(df)}".encode()).hexdigest()
+            source = model.source
+        
+        engine = create_engine(matrix, cache_key=data_key if persist else None,
+                               previous=None if refit else model.engine)
+        publish_model(ModelSnapshot(df, vectorizer, matrix, search, ids, scores,
+                                    data_key=data_key, source=source, drift=counts, engine=engine))
+        
+        print(f"✓ Ingested {len(raw)} movies ({len(df)} total, "
+              f"vocabulary drift {drift:.1%}{', refit' if refit else ''})")
+        return {'added': len(raw), 'total': len(df), 'refit': refit,
+                'vocabulary_drift': round(drift, 4)}
+
+def persist_ingested_movies(raw, df, vectorizer, matrix, search, drift):
+    """Append the new rows to movies.csv and cache the model for the new file;
+    returns the new cache key"""
+    csv_columns = pd.read_csv(MOVIES_CSV_PATH, nrows=0).columns
+    raw.reindex(columns=csv_columns).to_csv(MOVIES_CSV_PATH, mode='a', header=False, index=False)
+    cache_key = artifact_cache_key(MOVIES_CSV_PATH)
+    save_artifacts(cache_key, df, vectorizer, matrix, search, drift)
+    return cache_key
+
+# ============================================================================
+# Movie Serialization
+# ============================================================================
+# Response field -> (kind, default when the column is missing or empty, source column)
+MOVIE_FIELDS = {
+    'id': ('int', None, 'id'),  # null for rows without an id
+    'title': ('text', 'Unknown', 'title'),
+    'release_date': ('date', 'N/A', 'release_day'),
+    'vote_average': ('float', 0, 'vote_average'),
+    'vote_count': ('int', 0, 'vote_count'),
+    'overview': ('text', 'No overview available', 'overview'),
+    'genres': ('text', 'Unknown', 'genres'),
+    'popularity': ('float', 0, 'popularity'),
+}
+
+def build_movie_columns(df):
+    """Clean every response field once into a plain NumPy column"""
+    columns = {}
+    for field, (kind, default, source) in MOVIE_FIELDS.items():
+        if source not in df.columns:
+            values = np.full(len(df), default, dtype=object)
+        elif kind == 'date':
+            values = from_day_numbers(df[source].to_numpy(), missing=default)
+        elif kind == 'text':
+            text = df[source].astype(object)
+            values = text.where(text.notna(), default).to_numpy(dtype=object)
+        else:
+            numbers = pd.to_numeric(df[source], errors='coerce')
+            missing = numbers.isna().to_numpy()
+            numbers = numbers.fillna(0 if default is None else default).to_numpy()
+            if kind == 'int':
+                values = numbers.astype(np.int64)
+            elif numbers.dtype == np.float32:
+                # Go through the shortest decimal repr so 6.36 stays 6.36 in JSON
+                values = numbers.astype(str).astype(np.float64)
+            else:
+                values = numbers.astype(np.float64)
+            if default is None and missing.any():
+                values = values.astype(object)
+                values[missing] = None
+        columns[field] = values
+    return columns
+
+def serialize_movies(model, positions):
+    """List of movie dicts for the given row positions, extracted column-wise"""
+    positions = np.asarray(positions, dtype=np.intp)
+    values = [model.columns[field].take(positions).tolist() for field in MOVIE_FIELDS]
+    return [dict(zip(MOVIE_FIELDS, row)) for row in zip(*values)]
+
+# ============================================================================
+# Catalog Lookup
+# ============================================================================
+def normalize_title(title):
+    """Canonical form of a title used as the lookup key"""
+    return str(title).strip().lower()
+
+def build_title_index(df):
+    """Build the normalised-title -> row positions map"""
+    titles = {}
+    for pos, title in enumerate(df['title'].tolist()):
+        titles.setdefault(normalize_title(title), []).append(pos)
+    return titles
+
+class MovieIdIndex:
+    """Dataset id <-> row position, as sorted arrays searched with searchsorted
+
+    Ids are sparse (up to seven digits for ten thousand rows), so the id ->
+    position side is a sorted id array plus the matching positions rather than
+    an array indexed by id. The first row wins for repeated ids.
+    """
+
+    def __init__(self, ids):
+        ids = pd.to_numeric(pd.Series(ids, dtype=object), errors='coerce')
+        valid = ids.notna().to_numpy()
+        # Row position -> id, -1 where the row has none
+        self.by_position = np.where(valid, ids.fillna(-1).to_numpy(), -1).astype(np.int64)
+        
+        rows = np.flatnonzero(valid)
+        self.ids, first = np.unique(self.by_position[rows], return_index=True)
+        self.positions = rows[first].astype(np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def lookup(self, movie_ids):
+        """Row positions for an array of ids, -1 where an id isn't in the catalog"""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(movie_ids.shape, -1, dtype=np.int32)
+        slots = np.minimum(np.searchsorted(self.ids, movie_ids), len(self.ids) - 1)
+        return np.where(self.ids[slots] == movie_ids, self.positions[slots], -1).astype(np.int32)
+
+    def get(self, movie_id, default=None):
+        """Row position of one id, or `default`"""
+        try:
+            pos = int(self.lookup([movie_id])[0])
+        except (TypeError, ValueError, OverflowError):
+            return default
+        return pos if pos >= 0 else default
+
+    def id_at(self, pos):
+        """The id of the movie at a row position, or None"""
+        movie_id = int(self.by_position[pos])
+        return movie_id if movie_id >= 0 else None
+
+def find_movie(model, title, year=None, movie_id=None):
+    """Row position of a movie by title, or None if it is not in the catalog
+
+    Titles shared by several movies are disambiguated by `movie_id` (the
+    dataset's id column) or by release `year`; otherwise the first row wins.
+    """
+    positions = model.title_index.get(normalize_title(title))
+    if not positions:
+        return None
+    
+    if len(positions) > 1:
+        if movie_id is not None:
+            pos = model.movie_id_index.get(movie_id)
+            if pos in positions:
+                return pos
+        if year is not None:
+            dates = model.columns['release_date']
+            for pos in positions:
+                if dates[pos].startswith(str(year)):
+                    return pos
+    return positions[0]
+
+# ============================================================================
+# Recommendation Engine
+# ============================================================================
+NEIGHBOR_INDEX_PATH = os.environ.get('MOVIERECOMM_NEIGHBOR_INDEX', 'neighbors.idx')
+NEIGHBOR_INDEX_K = 50
+NEIGHBOR_INDEX_MAGIC = 0x494E524D  # b'MRNI'
+NEIGHBOR_INDEX_VERSION = 3
+NEIGHBOR_INDEX_HEADER = np.dtype([
+    ('magic', '<i4'), ('version', '<i4'), ('n_movies', '<i4'), ('k', '<i4'),
+    ('fingerprint', '<u8'), ('model', '<u8')
+])
+DEFAULT_RECOMMENDATIONS = 10
+MAX_RECOMMENDATIONS = 100
+MAX_BATCH_SEEDS = 1000
+FILTER_OVERFETCH = 5  # Neighbors fetched per requested one before facet filtering
+
+def top_k_indices(scores, k, exclude=None):
+    """Positions of the k highest scores along the last axis, best first
+
+    Uses argpartition, so the cost is O(N + k log k) instead of a full sort.
+    `exclude` holds one position per row (e.g. the seed movie itself) that
+    is never returned. Ties are broken by ascending position.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude is not None:
+        scores = scores.copy()
+        np.put_along_axis(scores, np.asarray(exclude).reshape(scores.shape[:-1] + (1,)),
+                          -np.inf, axis=-1)
+    
+    n = scores.shape[-1]
+    k = min(k, n - (1 if exclude is not None else 0))
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        settle_boundary_ties(scores, top)
+    else:
+        top = np.broadcast_to(np.arange(n), scores.shape).copy()
+    
+    top.sort(axis=-1)
+    order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(top, order, axis=-1)
+
+def settle_boundary_ties(scores, top):
+    """Make an argpartition selection deterministic, in place
+
+    argpartition keeps an arbitrary subset of the scores tied with the k-th
+    largest. Rows where some of those ties were left out get every higher
+    score plus the lowest-positioned ties instead.
+    """
+    k = top.shape[-1]
+    scores2d, top2d = scores.reshape(-1, scores.shape[-1]), top.reshape(-1, k)
+    chosen = np.take_along_axis(scores2d, top2d, axis=-1)
+    kth = chosen.min(axis=-1, keepdims=True)
+    tied = (scores2d == kth).sum(axis=-1)
+    for row in np.flatnonzero(tied > (chosen == kth).sum(axis=-1)):
+        above = np.flatnonzero(scores2d[row] > kth[row])
+        ties = np.flatnonzero(scores2d[row] == kth[row])[:k - len(above)]
+        top2d[row] = np.concatenate([above, ties])
+
+def build_neighbor_index(path=NEIGHBOR_INDEX_PATH, k=NEIGHBOR_INDEX_K, chunk_size=512, model=None):
+    """Write the top-K neighbor table for the current catalog to a binary file
+
+    Layout: a 32 byte header, then an (N, K) int32 block of neighbor row
+    positions, then an (N, K) float32 block of their cosine scores. Each
+    row is sorted by descending score and never contains the movie itself.
+    """
+    model = model or current_model()
+    tfidf_matrix = model.tfidf_matrix
+    n = tfidf_matrix.shape[0]
+    k = min(k, n - 1)
+    header = np.array([(NEIGHBOR_INDEX_MAGIC, NEIGHBOR_INDEX_VERSION, n, k,
+                        catalog_fingerprint(model.df, n), model_fingerprint(model.vectorizer))],
+                      dtype=NEIGHBOR_INDEX_HEADER)
+    ids = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        block = (tfidf_matrix[start:stop] @ tfidf_matrix.T).toarray()
+        top = top_k_indices(block, k, exclude=np.arange(start, stop))
+        ids[start:stop] = top
+        scores[start:stop] = np.take_along_axis(block, top, axis=1)
+    
+    # Write next to the target and rename, so running workers never map
+    # a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        header.tofile(f)
+        ids.tofile(f)
+        scores.tofile(f)
+    os.replace(tmp_path, path)
+    print(f"✓ Neighbor index written: {path} ({n} movies, K={k})")
+
+def catalog_fingerprint(df, n):
+    """64-bit hash of the first n titles, to tie an index file to its catalog"""
+    digest = hashlib.sha256('\n'.join(map(str, df['title'].iloc[:n].tolist())).encode('utf-8'))
+    return int.from_bytes(digest.digest()[:8], 'little')
+
+def model_fingerprint(vectorizer):
+    """64-bit hash of a fitted vocabulary and idf, to tie an index file to the
+    TF-IDF fit its scores were computed in"""
+    digest = hashlib.sha256(json.dumps(sorted((term, int(i)) for term, i in vectorizer.vocabulary_.items()))
+                            .encode('utf-8'))
+    digest.update(np.ascontiguousarray(vectorizer.idf_, dtype=np.float64).tobytes())
+    return int.from_bytes(digest.digest()[:8], 'little')
+
+def discard_neighbor_index(path=NEIGHBOR_INDEX_PATH):
+    """Delete an index file that no longer matches the model on disk"""
+    try:
+        os.remove(path)
+        print(f"  Removed stale neighbor index {path}: rebuild it with build_neighbor_index.py")
+    except FileNotFoundError:
+        pass
+
+def load_neighbor_index(df, vectorizer, path=NEIGHBOR_INDEX_PATH):
+    """Memory-map the neighbor index, or return (None, None) if unusable
+
+    The index may cover only a prefix of the catalog: rows ingested after it
+    was built are scored on demand and merged in by similar_movies().
+    """
+    if not os.path.exists(path):
+        print(f"  Neighbor index not found ({path}), using on-demand scoring")
+        return None, None
+    
+    try:
+        header = np.fromfile(path, dtype=NEIGHBOR_INDEX_HEADER, count=1)[0]
+        if (header['magic'] != NEIGHBOR_INDEX_MAGIC or
+                header['version'] != NEIGHBOR_INDEX_VERSION):
+            print(f"✗ Neighbor index {path} has an unknown format, ignoring it")
+            return None, None
+        if (header['n_movies'] > len(df) or
+                header['fingerprint'] != catalog_fingerprint(df, int(header['n_movies']))):
+            print(f"✗ Neighbor index {path} was built for a different catalog, ignoring it")
+            return None, None
+        if header['model'] != model_fingerprint(vectorizer):
+            print(f"✗ Neighbor index {path} was built from a different TF-IDF fit, ignoring it")
+            return None, None
+        
+        n, k = int(header['n_movies']), int(header['k'])
+        offset = NEIGHBOR_INDEX_HEADER.itemsize
+        ids = np.memmap(path, dtype=np.int32, mode='r', offset=offset, shape=(n, k))
+        scores = np.memmap(path, dtype=np.float32, mode='r',
+                           offset=offset + ids.nbytes, shape=(n, k))
+        print(f"✓ Neighbor index mapped: {path} (K={k})")
+        return ids, scores
+    except Exception as e:
+        print(f"✗ Error loading neighbor index: {e}")
+        return None, None
+
+# --- Similarity engines --------------------------------------------------------
+# Answer "top-K most similar rows" when the precomputed neighbor index
+# cannot. The exact engine scores the whole catalog; approximate engines
+# trade a little recall for sub-linear query time on large catalogs.
+RECOMMENDER_CONFIG = {
+    'engine': os.environ.get('MOVIERECOMM_RECOMMENDER', 'exact'),
+    'ivf_lists': int(os.environ.get('MOVIERECOMM_IVF_LISTS', 0)),    # 0 = sqrt(N) clusters
+    'ivf_probes': int(os.environ.get('MOVIERECOMM_IVF_PROBES', 16)),  # More probes: higher recall, slower queries
+    'ivf_train_sample': 50000,  # Rows used to fit the centroids
+    'ivf_iterations': 10,
+    'lsa_dimensions': int(os.environ.get('MOVIERECOMM_LSA_DIMENSIONS', 128)),  # 64-256
+}
+
+class ExactEngine:
+    """Brute-force cosine similarity with a sparse matrix product"""
+
+    name = 'exact'
+    tfidf_space = True  # Ranks by TF-IDF cosine, like the neighbor index
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, matrix, cache_key=None, previous=None):
+        """Engine for a snapshot; `cache_key` names its artifact cache entry and
+        `previous` is the engine of the snapshot it extends, if any"""
+        return cls(matrix)
+
+    @property
+    def nbytes(self):
+        """Memory held for similarity search"""
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def query(self, idx, k):
+        scores = (self.matrix @ self.matrix[idx].T).toarray().ravel()
+        return top_k_indices(scores, k, exclude=idx)
+
+    def scores(self, idx, rows):
+        """Similarity of movie `idx` to each of `rows`, in this engine's space"""
+        return (self.matrix[rows] @ self.matrix[idx].T).toarray().ravel()
+
+    def query_batch(self, positions, k, chunk_size=256):
+        k = min(k, self.matrix.shape[0] - 1)
+        result = np.empty((len(positions), max(k, 0)), dtype=np.intp)
+        for start in range(0, len(positions), chunk_size):
+            seeds = positions[start:start + chunk_size]
+            block = (self.matrix[seeds] @ self.matrix.T).toarray()
+            result[start:start + len(seeds)] = top_k_indices(block, k, exclude=seeds)
+        return result
+
+class IVFEngine(ExactEngine):
+    """Inverted-file index: spherical k-means clusters over the TF-IDF rows
+
+    Rows are assigned to their nearest of `lists` centroids. A query ranks
+    the centroids, gathers the rows of the `probes` closest clusters and
+    scores only those exactly, so the cost is about probes / lists of a
+    full scan. Queries with fewer than k candidates fall back to exact
+    scoring.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, matrix, lists=None, probes=None, seed=0, chunk_size=65536):
+        super().__init__(matrix)
+        n = matrix.shape[0]
+        lists = lists or RECOMMENDER_CONFIG['ivf_lists'] or int(np.sqrt(n))
+        self.lists = max(1, min(lists, n))
+        self.probes = max(1, min(probes or RECOMMENDER_CONFIG['ivf_probes'], self.lists))
+        
+        # Fit centroids on a sample; every worker uses the same seed
+        rng = np.random.default_rng(seed)
+        sample = matrix[np.sort(rng.choice(n, min(n, RECOMMENDER_CONFIG['ivf_train_sample']), replace=False))]
+        centroids = sample[rng.choice(sample.shape[0], self.lists, replace=False)].toarray()
+        for _ in range(RECOMMENDER_CONFIG['ivf_iterations']):
+            assignment = np.asarray(sample @ centroids.T).argmax(axis=1)
+            members = scipy.sparse.csr_matrix(
+                (np.ones(len(assignment)), (assignment, np.arange(len(assignment)))),
+                shape=(self.lists, sample.shape[0]))
+            sums = (members @ sample).toarray()
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0  # Empty clusters keep their previous centroid
+            centroids[filled] = sums[filled] / norms[filled, None]
+        # Term-major layout: a query only touches the rows of its own terms
+        self.centroid_terms = np.ascontiguousarray(centroids.T, dtype=matrix.dtype)
+        
+        assignment = np.empty(n, dtype=np.intp)
+        for start in range(0, n, chunk_size):
+            assignment[start:start + chunk_size] = np.asarray(
+                matrix[start:start + chunk_size] @ self.centroid_terms).argmax(axis=1)
+        
+        # Rows grouped by cluster; list c is order[bounds[c]:bounds[c + 1]]
+        self.order = np.argsort(assignment, kind='stable')
+        self.bounds = np.searchsorted(assignment[self.order], np.arange(self.lists + 1))
+
+    @property
+    def nbytes(self):
+        return (super().nbytes + self.centroid_terms.nbytes +
+                self.order.nbytes + self.bounds.nbytes)
+
+    def candidates(self, idx):
+        """Row positions in the clusters closest to row `idx`"""
+        row = self.matrix[idx]
+        closeness = row.data @ self.centroid_terms[row.indices]
+        probed = top_k_indices(closeness, self.probes)
+        return np.concatenate([self.order[self.bounds[c]:self.bounds[c + 1]] for c in probed])
+
+    def query(self, idx, k):
+        candidates = self.candidates(idx)
+        candidates = candidates[candidates != idx]
+        if len(candidates) < k:
+            return super().query(idx, k)
+        
+        scores = (self.matrix[candidates] @ self.matrix[idx].T).toarray().ravel()
+        return candidates[top_k_indices(scores, k)]
+
+    def query_batch(self, positions, k):
+        k = min(k, self.matrix.shape[0] - 1)
+        return np.array([self.query(idx, k) for idx in positions],
+                        dtype=np.intp).reshape(len(positions), max(k, 0))
+
+class LSAEngine(ExactEngine):
+    """Latent semantic analysis: TruncatedSVD projection of the TF-IDF rows
+
+    Rows are embedded in `dimensions` (64-256) latent dimensions, normalised
+    and stored as one contiguous float32 array, so similarity is a dense
+    BLAS matrix-vector product instead of a sparse one over 5,000 terms.
+    Related movies that share no exact terms can also score as similar.
+    """
+
+    name = 'lsa'
+    tfidf_space = False
+
+    def __init__(self, matrix, dimensions=None, seed=0, components=None, embeddings=None):
+        if components is None:
+            dimensions = dimensions or RECOMMENDER_CONFIG['lsa_dimensions']
+            dimensions = max(1, min(dimensions, min(matrix.shape) - 1))
+            svd = TruncatedSVD(n_components=dimensions, random_state=seed).fit(matrix)
+            components = svd.components_
+        # (dimensions, terms) projection; kept to fold in ingested rows
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.dimensions = self.components.shape[0]
+        
+        if embeddings is None:
+            embeddings = self.project(matrix)
+        elif embeddings.shape[0] < matrix.shape[0]:
+            # Rows appended since the embeddings were computed are projected
+            # into the same latent space instead of refitting it
+            embeddings = np.vstack([embeddings, self.project(matrix[embeddings.shape[0]:])])
+        
+        # The sparse matrix is only referenced, never searched
+        super().__init__(matrix)
+        self.embeddings = embeddings
+
+    def project(self, rows):
+        """Normalised float32 embeddings of TF-IDF rows"""
+        embeddings = np.ascontiguousarray(rows @ self.components.T, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+        return embeddings
+
+    @classmethod
+    def build(cls, matrix, cache_key=None, previous=None):
+        # Embeddings live in the snapshot's artifact cache entry, memory-mapped
+        # so every worker shares one copy; an ingest snapshot extends the
+        # previous engine's space
+        dimensions = max(1, min(RECOMMENDER_CONFIG['lsa_dimensions'], min(matrix.shape) - 1))
+        prefix = os.path.join(ARTIFACT_CACHE_DIR, cache_key, f'lsa-{dimensions}') if cache_key else None
+        if isinstance(previous, cls) and previous.dimensions == dimensions:
+            engine = cls(matrix, components=previous.components, embeddings=previous.embeddings)
+        else:
+            engine = cls.load(matrix, prefix) if prefix else None
+            if engine is not None:
+                return engine
+            engine = cls(matrix, dimensions)
+        if prefix and os.path.isdir(os.path.dirname(prefix)):
+            engine.save(prefix)
+        return engine
+
+    @classmethod
+    def load(cls, matrix, prefix):
+        """Engine from saved components and embeddings, or None if missing or stale"""
+        try:
+            components = np.load(f'{prefix}-components.npy')
+            embeddings = np.load(f'{prefix}-embeddings.npy', mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if embeddings.shape[0] != matrix.shape[0] or components.shape[1] != matrix.shape[1]:
+            return None
+        return cls(matrix, components=components, embeddings=embeddings)
+
+    def save(self, prefix):
+        try:
+            for name, array in (('components', self.components), ('embeddings', self.embeddings)):
+                tmp_path = f'{prefix}-{name}.tmp.npy'
+                np.save(tmp_path, array)
+                os.replace(tmp_path, f'{prefix}-{name}.npy')
+        except OSError as e:
+            print(f"✗ Could not cache LSA embeddings: {e}")
+
+    @property
+    def nbytes(self):
+        return self.embeddings.nbytes + self.components.nbytes
+
+    def query(self, idx, k):
+        return top_k_indices(self.embeddings @ self.embeddings[idx], k, exclude=idx)
+
+    def scores(self, idx, rows):
+        return self.embeddings[rows] @ self.embeddings[idx]
+
+    def query_batch(self, positions, k, chunk_size=1024):
+        k = min(k, self.embeddings.shape[0] - 1)
+        result = np.empty((len(positions), max(k, 0)), dtype=np.intp)
+        for start in range(0, len(positions), chunk_size):
+            seeds = positions[start:start + chunk_size]
+            block = self.embeddings[seeds] @ self.embeddings.T
+            result[start:start + len(seeds)] = top_k_indices(block, k, exclude=seeds)
+        return result
+
+RECOMMENDER_ENGINES = {
+    ExactEngine.name: ExactEngine,
+    IVFEngine.name: IVFEngine,
+    LSAEngine.name: LSAEngine,
+}
+
+def create_engine(matrix, engine=None, cache_key=None, previous=None):
+    """Instantiate the configured similarity engine for a TF-IDF matrix"""
+    engine = engine or RECOMMENDER_CONFIG['engine']
+    if engine not in RECOMMENDER_ENGINES:
+        raise ValueError(f"Unknown recommender engine '{engine}' (choose from {', '.join(RECOMMENDER_ENGINES)})")
+    return RECOMMENDER_ENGINES[engine].build(matrix, cache_key=cache_key, previous=previous)
+
+def similar_movies(model, idx, k=DEFAULT_RECOMMENDATIONS):
+    """Row positions of the k movies most similar to movie `idx`"""
+    tfidf_matrix, neighbor_ids = model.tfidf_matrix, model.neighbor_ids
+    if neighbor_ids is not None and idx < neighbor_ids.shape[0] and k <= neighbor_ids.shape[1]:
+        # Precomputed neighbors: a single slice of the shared memmap
+        ids = np.asarray(neighbor_ids[idx, :k])
+        indexed = neighbor_ids.shape[0]
+        if indexed == tfidf_matrix.shape[0]:
+            return ids
+        
+        # Movies ingested after the index was built are scored on demand
+        # and merged with the precomputed candidates
+        delta = (tfidf_matrix[indexed:] @ tfidf_matrix[idx].T).toarray().ravel()
+        candidates = np.concatenate([ids, np.arange(indexed, tfidf_matrix.shape[0])])
+        scores = np.concatenate([np.asarray(model.neighbor_scores[idx, :k], dtype=np.float64), delta])
+        return candidates[top_k_indices(scores, k)]
+    return model.engine.query(idx, k)
+
+def similar_movies_batch(model, positions, k=DEFAULT_RECOMMENDATIONS):
+    """(len(positions), k) row positions of the movies most similar to each seed
+
+    Seeds are answered from the neighbor index when it covers the whole
+    catalog; otherwise by the similarity engine (for the exact engine, one
+    sparse matrix-matrix product and row-wise top-K per chunk of seeds).
+    """
+    positions = np.asarray(positions, dtype=np.intp)
+    neighbor_ids = model.neighbor_ids
+    if (neighbor_ids is not None and neighbor_ids.shape[0] == model.tfidf_matrix.shape[0] and
+            k <= neighbor_ids.shape[1]):
+        return np.asarray(neighbor_ids[positions, :k], dtype=np.intp)
+    return model.engine.query_batch(positions, k)
+
+def filtered_similar_movies(model, idx, k, selection):
+    """Like similar_movies(), restricted to the rows of a facet selection"""
+    fetch = min(max(k * FILTER_OVERFETCH, NEIGHBOR_INDEX_K), len(model) - 1)
+    candidates = similar_movies(model, idx, fetch)
+    kept = candidates[model.facets.contains(selection, candidates)]
+    if len(kept) >= k or fetch >= len(model) - 1:
+        return kept[:k]
+    
+    # Too selective for the nearest candidates: score the selected rows exactly
+    rows = np.flatnonzero(model.facets.unpack(selection))
+    rows = rows[rows != idx]
+    return rows[top_k_indices(model.engine.scores(idx, rows), k)]
+
+# ============================================================================
+# Personalised Recommendations
+# ============================================================================
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TTL = 300  # Bounds staleness from preference writes made in other workers
+USER_RATING_RANGE = (0.0, 10.0)  # Same scale as the catalog's vote_average
+
+profile_cache = OrderedDict()  # user_id -> (model version, cached_at, profile, seen positions)
+profile_cache_lock = threading.Lock()
+
+def preference_weights(preferences):
+    """Profile weight per preference: the rating as a fraction of the rating
+    scale (so every liked movie pulls the profile towards it), plus one for
+    favourites. Unrated movies weigh the user's average rated weight, and a
+    history without ratings weighs 1 each."""
+    low, high = USER_RATING_RANGE
+    ratings = np.array([p['rating'] if p['rating'] is not None else np.nan for p in preferences],
+                       dtype=np.float64)
+    if np.isnan(ratings).all():
+        weights = np.ones(len(preferences))
+    else:
+        weights = np.clip((ratings - low) / (high - low), 0.0, 1.0)
+        weights[np.isnan(weights)] = np.nanmean(weights)
+    weights += [1.0 if p['is_favorite'] else 0.0 for p in preferences]
+    return weights
+
+def build_user_profile(model, preferences):
+    """(profile, seen) for a preference history: the L2-normalised weighted sum
+    of the rated movies' TF-IDF rows, and their row positions"""
+    positions = model.movie_id_index.lookup([pref['movie_id'] for pref in preferences])
+    found = positions >= 0
+    positions = positions[found]
+    kept = [pref for pref, keep in zip(preferences, found) if keep]
+    seen = np.unique(positions.astype(np.intp))
+    if not kept:
+        return None, seen
+    
+    weights = scipy.sparse.csr_matrix(preference_weights(kept).reshape(1, -1))
+    profile = weights @ model.tfidf_matrix[positions]
+    norm = scipy.sparse.linalg.norm(profile)
+    if norm == 0:
+        return None, seen
+    return (profile / norm).tocsr(), seen
+
+def user_profile(model, user_id):
+    """Cached (profile, seen) for a user, rebuilt from UserPreferences on a miss"""
+    now = time.monotonic()
+    with profile_cache_lock:
+        entry = profile_cache.get(user_id)
+        if entry is not None and entry[0] == model.version and now - entry[1] < PROFILE_CACHE_TTL:
+            profile_cache.move_to_end(user_id)
+            return entry[2], entry[3]
+    
+    profile, seen = build_user_profile(model, user_data(user_id, 'preferences'))
+    with profile_cache_lock:
+        profile_cache[user_id] = (model.version, now, profile, seen)
+        profile_cache.move_to_end(user_id)
+        while len(profile_cache) > PROFILE_CACHE_SIZE:
+            profile_cache.popitem(last=False)
+    return profile, seen
+
+def invalidate_user_profile(user_id):
+    """Drop a user's cached profile after they write a preference"""
+    with profile_cache_lock:
+        profile_cache.pop(user_id, None)
+
+def personalised_movies(model, profile, seen, k=DEFAULT_RECOMMENDATIONS, selection=None,
+                        weights=None):
+    """Row positions of the k unseen movies closest to a user profile,
+    optionally restricted to a facet selection and re-ranked by a hybrid blend"""
+    scores = (model.tfidf_matrix @ profile.T).toarray().ravel()
+    if selection is not None:
+        scores[~model.facets.unpack(selection)] = -np.inf
+    scores[seen] = -np.inf
+    if weights is None or is_content_blend(weights):
+        top = top_k_indices(scores, k)
+        return top[np.isfinite(scores[top])]
+    
+    top = top_k_indices(scores, max(k * HYBRID_CANDIDATES, NEIGHBOR_INDEX_K))
+    top = top[np.isfinite(scores[top])]
+    return hybrid_rank(model, top, scores[top], weights, k)
+
+# ============================================================================
+# Popularity Rankings
+# ============================================================================
+DEFAULT_POPULAR_LIMIT = 20
+MAX_POPULAR_LIMIT = 100
+RATING_PRIOR_QUANTILE = 0.80  # Votes needed before a rating is trusted (IMDb's "m")
+RECENCY_HALF_LIFE_DAYS = 365
+
+def bayesian_ratings(df):
+    """IMDb-style weighted rating: v/(v+m)*R + m/(v+m)*C"""
+    votes = pd.to_numeric(df['vote_count'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    rating = pd.to_numeric(df['vote_average'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    rated = votes > 0
+    mean_rating = rating[rated].mean() if rated.any() else 0.0
+    min_votes = max(np.quantile(votes, RATING_PRIOR_QUANTILE), 1.0) if len(votes) else 1.0
+    return (votes * rating + min_votes * mean_rating) / (votes + min_votes)
+
+def recency_weights(df, half_life_days=RECENCY_HALF_LIFE_DAYS):
+    """Exponential decay by age, relative to the newest release in the catalog"""
+    days = df['release_day'].to_numpy(dtype=np.int64)
+    dated = days != MISSING_DAY
+    if dated.any():
+        oldest = days[dated].min()  # Undated counts as oldest
+        age_days = (days[dated].max() - np.where(dated, days, oldest)).astype(np.float64)
+    else:
+        age_days = np.zeros(len(df))
+    return np.power(0.5, age_days / half_life_days)
+
+def ranking_signals(df):
+    """Raw popularity and Bayesian rating per row (for the columns present),
+    computed once per snapshot for the rankings, priors and sort orders"""
+    signals = {}
+    columns = set(df.columns)
+    if 'popularity' in columns:
+        signals['popularity'] = pd.to_numeric(df['popularity'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    if {'vote_average', 'vote_count'} <= columns:
+        signals['rating'] = bayesian_ratings(df)
+    return signals
+
+def build_popularity_orders(df, signals=None):
+    """Row positions of the catalog under each ranking, best first"""
+    def ranked(values):
+        return np.argsort(-values, kind='stable').astype(np.int32)
+    
+    signals = ranking_signals(df) if signals is None else signals
+    orders = {}
+    if 'popularity' in signals:
+        orders['popularity'] = ranked(signals['popularity'])
+        if 'release_day' in df.columns:
+            orders['trending'] = ranked(signals['popularity'] * recency_weights(df))
+    if 'rating' in signals:
+        orders['rating'] = ranked(signals['rating'])
+    if not orders:
+        orders['catalog'] = np.arange(len(df), dtype=np.int32)
+    return orders
+
+# ============================================================================
+# Hybrid Ranking
+# ============================================================================
+HYBRID_SIGNALS = ('similarity', 'rating', 'popularity', 'recency')
+HYBRID_PRESETS = {
+    'content': {'similarity': 1.0},  # Pure TF-IDF order
+    'balanced': {'similarity': 0.6, 'rating': 0.2, 'popularity': 0.15, 'recency': 0.05},
+    'popular': {'similarity': 0.4, 'rating': 0.2, 'popularity': 0.4},
+    'acclaimed': {'similarity': 0.5, 'rating': 0.5},
+    'fresh': {'similarity': 0.5, 'rating': 0.1, 'popularity': 0.1, 'recency': 0.3},
+}
+HYBRID_DEFAULT_BLEND = os.environ.get('MOVIERECOMM_BLEND', 'content')
+HYBRID_CANDIDATES = 5  # Candidates re-ranked per requested movie (at least NEIGHBOR_INDEX_K)
+HYBRID_RECENCY_HALF_LIFE_DAYS = 5 * 365
+
+def build_ranking_priors(df, signals=None):
+    """(3, N) float32 rows of rating, log-popularity and recency, each scaled to [0, 1]
+
+    The rating row is the Bayesian weighted rating, so a 9.0 from two votes
+    ranks below a well-established 8.0.
+    """
+    def scaled(values):
+        if not len(values) or values.max() <= values.min():
+            return np.zeros(len(values))
+        return (values - values.min()) / (values.max() - values.min())
+    
+    signals = ranking_signals(df) if signals is None else signals
+    priors = np.zeros((3, len(df)), dtype=np.float32)
+    if 'rating' in signals:
+        priors[0] = scaled(signals['rating'])
+    if 'popularity' in signals:
+        priors[1] = scaled(np.log1p(np.maximum(signals['popularity'], 0)))
+    if 'release_day' in df.columns:
+        priors[2] = recency_weights(df, HYBRID_RECENCY_HALF_LIFE_DAYS)
+    return priors
+
+def blend_weights(blend=None, overrides=None):
+    """(name, weight per HYBRID_SIGNALS) for a preset name and optional
+    "signal:weight,..." overrides on top of it. Raises ValueError."""
+    name = blend or HYBRID_DEFAULT_BLEND
+    if name not in HYBRID_PRESETS:
+        raise ValueError(f"Unknown blend '{name}' (choose from {', '.join(HYBRID_PRESETS)})")
+    weights = dict(HYBRID_PRESETS[name])
+    
+    if overrides:
+        for part in overrides.split(','):
+            signal, _, value = part.partition(':')
+            signal = signal.strip()
+            if signal not in HYBRID_SIGNALS:
+                raise ValueError(f"Unknown signal '{signal}' (choose from {', '.join(HYBRID_SIGNALS)})")
+            try:
+                weights[signal] = float(value)
+            except ValueError:
+                raise ValueError(f"Weight for '{signal}' must be a number")
+        name = f"{name}+custom"
+    
+    weights = np.array([weights.get(signal, 0.0) for signal in HYBRID_SIGNALS], dtype=np.float64)
+    if (weights < 0).any() or not np.isfinite(weights).all() or not weights.any():
+        raise ValueError("Blend weights must be non-negative and not all zero")
+    return name, weights
+
+def is_content_blend(weights):
+    """True if a blend ranks by similarity alone (no re-ranking needed)"""
+    return not weights[1:].any()
+
+def hybrid_rank(model, candidates, similarity, weights, k):
+    """The k candidates with the highest blended score, best first
+
+    Similarity is scaled by the best candidate's so it spans [0, 1] like the
+    priors. Ties keep the candidates' similarity order.
+    """
+    candidates = np.asarray(candidates, dtype=np.intp)
+    similarity = np.asarray(similarity, dtype=np.float64)
+    best = similarity.max() if len(similarity) else 0
+    if best > 0:
+        similarity = similarity / best
+    scores = weights[0] * similarity + weights[1:] @ model.priors[:, candidates]
+    return candidates[top_k_indices(scores, k)]
+
+def hybrid_similar_movies(model, idx, k, weights, selection=None):
+    """similar_movies() (or filtered_similar_movies() for a facet selection)
+    re-ranked by a blend of similarity and the rating/popularity/recency priors"""
+    fetch = min(max(k * HYBRID_CANDIDATES, NEIGHBOR_INDEX_K), len(model) - 1)
+    neighbor_ids = model.neighbor_ids
+    if (selection is None and neighbor_ids is not None and neighbor_ids.shape[0] == len(model) and
+            fetch <= neighbor_ids.shape[1]):
+        # Precomputed neighbors come with their similarity scores
+        candidates = np.asarray(neighbor_ids[idx, :fetch], dtype=np.intp)
+        similarity = model.neighbor_scores[idx, :fetch]
+    else:
+        if selection is None:
+            candidates = similar_movies(model, idx, fetch)
+        else:
+            candidates = filtered_similar_movies(model, idx, fetch, selection)
+        similarity = model.engine.scores(idx, candidates)
+    return hybrid_rank(model, candidates, similarity, weights, k)
+
+# ============================================================================
+# Facets
+# ============================================================================
+RATING_BUCKETS = 10  # vote_average 0-10 in whole-point buckets
+
+class FacetIndex:
+    """Per-value bitsets over the catalog for filtering and facet counts
+
+    Each facet value (a language, a release year, the adult flag, a rating
+    bucket) owns a packed bitset with one bit per row. A filter is an OR
+    over the selected values of a facet, and filters on several facets are
+    a bitwise AND, so any combination costs a few passes over N/8 bytes.
+    Facet counts come from a bincount of per-row value codes.
+    """
+
+    def __init__(self, df):
+        self.size = len(df)
+        columns = set(df.columns)
+        self.labels = {}  # facet -> value labels, indexed by code
+        self.codes = {}   # facet -> per-row value code (-1: no value)
+        self.bits = {}    # facet -> (values, N/8) packed bitsets
+        
+        if 'original_language' in columns:
+            languages = pd.Categorical(df['original_language'])
+            self._add('language', [str(v).lower() for v in languages.categories], languages.codes)
+        
+        if 'release_day' in columns:
+            days = df['release_day'].to_numpy()
+            dated = days != MISSING_DAY
+            years = np.full(self.size, -1, dtype=np.int64)
+            years[dated] = days[dated].astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+            labels, codes = np.unique(years[dated], return_inverse=True)
+            year_codes = np.full(self.size, -1, dtype=np.int64)
+            year_codes[dated] = codes
+            self._add('year', labels.tolist(), year_codes)  # Sorted, so a year range is a slice
+            
+            decades, decade_codes = np.unique(years[dated] // 10 * 10, return_inverse=True)
+            self.labels['decade'] = [f"{decade}s" for decade in decades.tolist()]
+            self.codes['decade'] = np.full(self.size, -1, dtype=np.int64)
+            self.codes['decade'][dated] = decade_codes
+        
+        if 'adult' in columns:
+            self._add('adult', [False, True], df['adult'].astype(bool).to_numpy().astype(np.int64))
+        
+        if {'vote_average', 'vote_count'} <= columns:
+            rating = pd.to_numeric(df['vote_average'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+            rated = pd.to_numeric(df['vote_count'], errors='coerce').fillna(0).to_numpy() > 0
+            buckets = np.clip(np.floor(rating), 0, RATING_BUCKETS - 1).astype(np.int64)
+            self._add('rating', list(range(RATING_BUCKETS)), np.where(rated, buckets, -1))
+        
+        # Vote counts are a threshold, not a set of values
+        self.votes = None
+        if 'vote_count' in columns:
+            self.votes = SortedColumn(pd.to_numeric(df['vote_count'], errors='coerce').fillna(0)
+                                      .to_numpy(dtype=np.float64))
+        
+        self.total_counts = self.counts(None)
+
+    def _add(self, facet, labels, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        self.labels[facet] = labels
+        self.codes[facet] = codes
+        self.bits[facet] = np.packbits(codes[None, :] == np.arange(len(labels))[:, None], axis=1)
+
+    def _any_of(self, facet, codes):
+        """OR of the bitsets for the given value codes of a facet"""
+        bits = self.bits[facet]
+        if len(codes) == 0:
+            return np.zeros(bits.shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(bits[codes], axis=0)
+
+    def select(self, filters):
+        """Packed bitset of the rows passing every filter (None: no filters)
+
+        filters: language (list), year_from / year_to (inclusive), adult
+        (bool), rating (list of buckets 0-9) and min_votes.
+        """
+        parts = []
+        missing = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        
+        if filters.get('language'):
+            if 'language' in self.bits:
+                index = {label: code for code, label in enumerate(self.labels['language'])}
+                parts.append(self._any_of('language', [index[v] for v in filters['language'] if v in index]))
+            else:
+                parts.append(missing)
+        
+        year_from, year_to = filters.get('year_from'), filters.get('year_to')
+        if year_from is not None or year_to is not None:
+            if 'year' in self.bits:
+                years = self.labels['year']
+                start = 0 if year_from is None else int(np.searchsorted(years, year_from, side='left'))
+                stop = len(years) if year_to is None else int(np.searchsorted(years, year_to, side='right'))
+                parts.append(self._any_of('year', np.arange(start, stop)))
+            else:
+                parts.append(missing)
+        
+        if filters.get('adult') is not None:
+            parts.append(self.bits['adult'][int(filters['adult'])] if 'adult' in self.bits else missing)
+        
+        if filters.get('rating'):
+            if 'rating' in self.bits:
+                parts.append(self._any_of('rating', [b for b in filters['rating'] if 0 <= b < RATING_BUCKETS]))
+            else:
+                parts.append(missing)
+        
+        if filters.get('min_votes') is not None:
+            if self.votes is not None:
+                passed = np.zeros(self.size, dtype=bool)
+                passed[self.votes.between(filters['min_votes'])] = True
+                parts.append(np.packbits(passed))
+            else:
+                parts.append(missing)
+        
+        return np.bitwise_and.reduce(parts, axis=0) if parts else None
+
+    def unpack(self, selection):
+        """Bitset -> bool array with one entry per row"""
+        return np.unpackbits(selection, count=self.size).view(bool)
+
+    def contains(self, selection, positions):
+        """Bool array: which of `positions` are in the selection"""
+        positions = np.asarray(positions, dtype=np.intp)
+        return ((selection[positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+
+    def counts(self, positions):
+        """{facet: {label: count}} over the given rows (None: the whole catalog)"""
+        result = {}
+        for facet, codes in self.codes.items():
+            if facet == 'year':
+                continue  # Reported by decade
+            values = codes if positions is None else codes[positions]
+            tally = np.bincount(values[values >= 0], minlength=len(self.labels[facet]))
+            result[facet] = {str(label).lower() if isinstance(label, bool) else str(label): int(count)
+                             for label, count in zip(self.labels[facet], tally.tolist()) if count}
+        return result
+
+def facet_filter_key(filters):
+    """Hashable, canonical form of the active filters"""
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in filters.items() if value not in (None, [])))
+
+# ============================================================================
+# Catalog Browsing
+# ============================================================================
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+BROWSE_FILTER_CACHE_SIZE = 128  # Filtered orders kept per model
+
+class SortedColumn:
+    """Row positions sorted by one column, for range lookups by value"""
+
+    def __init__(self, values, positions=None):
+        values = np.asarray(values)
+        if positions is None:
+            positions = np.argsort(values, kind='stable').astype(np.int32)
+        self.positions = positions
+        self.values = values[self.positions]
+
+    def between(self, low=None, high=None):
+        """Row positions with low <= value <= high (either bound optional)"""
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left')
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side='right')
+        return self.positions[start:stop]
+
+    def rank_after(self, value, position):
+        """Index in the sorted order of the first row after (value, position)
+
+        Ties are stored by ascending row position, so (value, position) is
+        a unique, stable keyset cursor even when the catalog grows.
+        """
+        start = np.searchsorted(self.values, value, side='left')
+        stop = np.searchsorted(self.values, value, side='right')
+        return int(start + np.searchsorted(self.positions[start:stop], position, side='right'))
+
+    def accepts(self, value):
+        """True if `value` is comparable with this column (a str for text
+        columns, a finite number that fits the dtype otherwise)"""
+        if self.values.dtype == object:
+            return isinstance(value, str)
+        if isinstance(value, float):
+            return bool(np.isfinite(value))
+        return is_int64(value)
+
+class CatalogBrowser:
+    """Sort orders for paging through the catalog, filtered by facets
+
+    Every sort order is a SortedColumn over an ascending key (descending
+    rankings use negated values). The ranks that pass a filter combination
+    are computed once from the facet bitsets and cached with their facet
+    counts, after which any page, at any depth, is a binary search and a
+    slice.
+    """
+
+    def __init__(self, df, facets, popularity_orders, signals):
+        n = len(df)
         
-        # Create UserPreferences table
-        cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='UserPreferences' AND xtype='U')
-            CREATE TABLE UserPreferences (
-                pref_id INT IDENTITY(1,1) PRIMARY KEY,
-                user_id INT FOREIGN KEY REFERENCES Users(user_id),
-                movie_title VARCHAR(500),
-                rating FLOAT,
-                watched_date DATETIME DEFAULT GETDATE()
-            )
-        """)
+        self.orders = {'catalog': SortedColumn(np.arange(n))}
+        # /api/popular already ranked these (best first, ties by position),
+        # which is exactly the ascending order of the negated values
+        for sort in ('popularity', 'rating'):
+            if sort in signals:
+                self.orders[sort] = SortedColumn(-signals[sort], popularity_orders[sort])
+        if 'release_day' in df.columns:
+            # Undated movies (MISSING_DAY) sort last
+            self.orders['release_date'] = SortedColumn(-df['release_day'].to_numpy(dtype=np.int64))
+        self.orders['title'] = SortedColumn(np.array([normalize_title(t) for t in df['title'].tolist()],
+                                                     dtype=object))
         
-        conn.commit()
-        conn.close()
-        print("✓ Database tables initialized successfully")
-    except Exception as e:
-        print(f"✗ Database initialization error: {e}")
+        self.facets = facets
+        self.size = n
+        self._filtered = OrderedDict()
+        self._lock = threading.Lock()
 
-# ============================================================================
-# Helper Functions
-# ============================================================================
-def hash_password(password):
-    """Hash password using SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    def filtered_ranks(self, sort, filters):
+        """(ranks in `sort` of the rows passing `filters`, their facet counts);
+        ranks is None when nothing is filtered"""
+        key = (sort, facet_filter_key(filters))
+        if not key[1]:
+            return None, self.facets.total_counts
+        
+        with self._lock:
+            entry = self._filtered.get(key)
+            if entry is not None:
+                self._filtered.move_to_end(key)
+                return entry
+        
+        passed = self.facets.unpack(self.facets.select(filters))
+        ranks = np.flatnonzero(passed[self.orders[sort].positions]).astype(np.int32)
+        entry = (ranks, self.facets.counts(np.flatnonzero(passed)))
+        
+        with self._lock:
+            self._filtered[key] = entry
+            while len(self._filtered) > BROWSE_FILTER_CACHE_SIZE:
+                self._filtered.popitem(last=False)
+        return entry
+
+    def page(self, sort, filters, per_page, page=1, cursor=None):
+        """(row positions, total matches, facet counts, next cursor) for one page"""
+        order = self.orders[sort]
+        ranks, counts = self.filtered_ranks(sort, filters)
+        total = self.size if ranks is None else len(ranks)
+        
+        if cursor is not None:
+            rank = order.rank_after(*cursor)
+            start = rank if ranks is None else int(np.searchsorted(ranks, rank, side='left'))
+        else:
+            start = max(page - 1, 0) * per_page
+        
+        stop = min(start + per_page, total)
+        page_ranks = np.arange(start, stop) if ranks is None else ranks[start:stop]
+        positions = order.positions[page_ranks]
+        
+        next_cursor = None
+        if stop < total and len(page_ranks):
+            last = page_ranks[-1]
+            value = order.values[last]
+            value = value.item() if isinstance(value, np.generic) else value
+            next_cursor = encode_cursor(sort, value, int(order.positions[last]))
+        return positions, total, counts, next_cursor
+
+def encode_cursor(sort, value, position):
+    """Opaque keyset cursor for the row after which the next page starts"""
+    raw = json.dumps([sort, value, position], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """(sort, value, position) from encode_cursor(); raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort, value, position = json.loads(raw)
+        if not isinstance(sort, str) or not is_int64(position):
+            raise ValueError
+        return sort, value, position
+    except Exception:
+        raise ValueError("Invalid cursor")
 
 # ============================================================================
-# Movie Data Loading
+# Full-Text Search
 # ============================================================================
-movies_df = None
-tfidf_matrix = None
-cosine_sim = None
+SEARCH_FIELDS = {'title': 3.0, 'overview': 1.0, 'genres': 1.5}  # Field -> tf weight
+SEARCH_TOKEN_PATTERN = r"(?u)\b\w+\b"
+MAX_PREFIX_EXPANSIONS = 64
+PREFIX_MATCH_WEIGHT = 0.5
 
-def load_movies_data():
-    """Load and prepare movie dataset from Kaggle"""
-    global movies_df, tfidf_matrix, cosine_sim
-    
-    try:
-        movies_df = pd.read_csv('movies.csv', encoding='utf-8')
-        
-        print(f"Loaded {len(movies_df)} movies from dataset")
-        print(f"Columns: {list(movies_df.columns)}")
+class SearchIndex:
+    """In-memory inverted index over title, overview and genres with BM25 ranking
+
+    Postings live in a CSC matrix (one column per term), so a term's posting
+    list is a contiguous slice of sorted row positions plus weighted term
+    frequencies. Queries are AND over all terms; the last term also matches
+    as a prefix so type-ahead works.
+    """
+
+    def __init__(self, postings, terms, doc_len, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._analyzer = CountVectorizer(token_pattern=SEARCH_TOKEN_PATTERN).build_analyzer()
         
-        # Ensure required columns exist
-        if 'title' not in movies_df.columns:
-            movies_df['title'] = movies_df.iloc[:, 0]
+        self._postings = postings.tocsc()
+        self._postings.sort_indices()
+        self._doc_freq = np.diff(self._postings.indptr)
         
-        if 'overview' not in movies_df.columns:
-            movies_df['overview'] = ''
+        self._doc_len = np.asarray(doc_len, dtype=np.float32)
+        self._avg_doc_len = float(self._doc_len.mean()) if len(self._doc_len) else 0.0
         
-        if 'genres' not in movies_df.columns:
-            movies_df['genres'] = ''
+        # `terms` is sorted; term ids are column numbers in `postings`
+        self._vocabulary = {term: i for i, term in enumerate(terms)}
+        self._terms = np.array(terms, dtype=object)
+        self._term_ids = np.arange(len(terms), dtype=np.intp)
+
+    @classmethod
+    def build(cls, df):
+        """Tokenise the searchable fields of `df` into a new index"""
+        fields = [f for f in SEARCH_FIELDS if f in df.columns]
+        vectorizer = CountVectorizer(token_pattern=SEARCH_TOKEN_PATTERN, dtype=np.float32)
+        texts = {f: df[f].astype(object).fillna('').astype(str) for f in fields}
+        vectorizer.fit(pd.concat(texts.values()))
         
-        # Clean data
-        movies_df['overview'] = movies_df['overview'].fillna('')
-        movies_df['genres'] = movies_df['genres'].fillna('')
-        movies_df['title'] = movies_df['title'].fillna('Unknown')
+        tf = None
+        for f in fields:
+            counts = vectorizer.transform(texts[f]) * SEARCH_FIELDS[f]
+            tf = counts if tf is None else tf + counts
         
-        # Prepare features for recommendation engine
-        movies_df['combined_features'] = (
-            movies_df['title'].fillna('') + ' ' +
-            movies_df['overview'].fillna('') + ' ' + 
-            movies_df['genres'].fillna('')
-        )
+        # CountVectorizer numbers its vocabulary in sorted order
+        terms = vectorizer.get_feature_names_out().tolist()
+        return cls(tf, terms, np.asarray(tf.sum(axis=1)).ravel())
+
+    def save(self, directory):
+        """Write the index into an artifact cache directory"""
+        scipy.sparse.save_npz(os.path.join(directory, 'search_postings.npz'), self._postings,
+                              compressed=False)
+        np.save(os.path.join(directory, 'search_doc_len.npy'), self._doc_len)
+        with open(os.path.join(directory, 'search_terms.json'), 'w', encoding='utf-8') as f:
+            json.dump(self._terms.tolist(), f)
+
+    @classmethod
+    def load(cls, directory):
+        """Inverse of save()"""
+        postings = scipy.sparse.load_npz(os.path.join(directory, 'search_postings.npz'))
+        doc_len = np.load(os.path.join(directory, 'search_doc_len.npy'))
+        with open(os.path.join(directory, 'search_terms.json'), encoding='utf-8') as f:
+            terms = json.load(f)
+        return cls(postings, terms, doc_len)
+
+    def _expand_prefix(self, prefix):
+        """Ids of the terms starting with `prefix`, capped to the most frequent"""
+        lo = np.searchsorted(self._terms, prefix, side='left')
+        hi = np.searchsorted(self._terms, prefix + '\uffff', side='left')
+        term_ids = self._term_ids[lo:hi]
+        if len(term_ids) > MAX_PREFIX_EXPANSIONS:
+            keep = np.argsort(-self._doc_freq[term_ids], kind='stable')[:MAX_PREFIX_EXPANSIONS]
+            term_ids = term_ids[keep]
+        return term_ids
+
+    def _posting(self, term_id):
+        start, stop = self._postings.indptr[term_id], self._postings.indptr[term_id + 1]
+        return self._postings.indices[start:stop], self._postings.data[start:stop]
+
+    def _term_frequencies(self, term_id, docs):
+        """Weighted frequency of one term in each of the (sorted) candidate docs"""
+        posting_docs, posting_tf = self._posting(term_id)
+        where = np.minimum(np.searchsorted(posting_docs, docs), len(posting_docs) - 1)
+        return np.where(posting_docs[where] == docs, posting_tf[where], 0).astype(np.float32)
+
+    def _idf(self, doc_freq):
+        n_docs = len(self._doc_len)
+        return np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query, limit=20):
+        """Row positions of the best matches for `query`, best first"""
+        candidates, scores = self.score(query)
+        return candidates[top_k_indices(scores, limit)]
+
+    def score(self, query):
+        """(row positions, BM25 scores) of every document matching `query`"""
+        nothing = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32))
+        tokens = self._analyzer(query)
+        if not tokens:
+            return nothing
         
-        # Create TF-IDF matrix for content-based recommendations
-        tfidf = TfidfVectorizer(stop_words='english', max_features=5000)
-        tfidf_matrix = tfidf.fit_transform(movies_df['combined_features'])
-        cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
+        # Each query term maps to one or more index terms
+        groups = []
+        for i, token in enumerate(tokens):
+            is_prefix = i == len(tokens) - 1 and not query[-1:].isspace()
+            if is_prefix:
+                term_ids = self._expand_prefix(token)
+            else:
+                term_id = self._vocabulary.get(token)
+                term_ids = np.array([term_id] if term_id is not None else [], dtype=np.intp)
+            if len(term_ids) == 0:
+                return nothing
+            docs = np.unique(np.concatenate([self._posting(t)[0] for t in term_ids]))
+            groups.append((token, term_ids, docs))
         
-        print("✓ Movie recommendation engine initialized successfully!")
+        # AND across query terms (rarest first), OR across prefix expansions
+        candidates = None
+        for _, _, docs in sorted(groups, key=lambda g: len(g[2])):
+            candidates = docs if candidates is None else \
+                np.intersect1d(candidates, docs, assume_unique=True)
+            if len(candidates) == 0:
+                return nothing
         
-    except FileNotFoundError:
-        print("✗ ERROR: movies.csv not found!")
-        print("   Please download from: https://www.kaggle.com/datasets/amitksingh2103/trending-movies-over-the-years")
-    except Exception as e:
-        print(f"✗ Error loading movies: {e}")
+        # BM25, treating each prefix group as one pseudo-term whose frequency
+        # counts completions at a discount to an exact match of the token
+        length_norm = self.k1 * (1 - self.b + self.b * self._doc_len[candidates] / self._avg_doc_len)
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        for token, term_ids, docs in groups:
+            exact_id = self._vocabulary.get(token)
+            tf = np.zeros(len(candidates), dtype=np.float32)
+            for term_id in term_ids:
+                weight = 1.0 if term_id == exact_id else PREFIX_MATCH_WEIGHT
+                tf += weight * self._term_frequencies(term_id, candidates)
+            scores += self._idf(len(docs)) * tf * (self.k1 + 1) / (tf + length_norm)
+        return candidates, scores
+
+# ============================================================================
+# Response Cache
+# ============================================================================
+RESPONSE_CACHE_MAX_BYTES = int(float(os.environ.get('MOVIERECOMM_RESPONSE_CACHE_MB', 64)) * 1024 * 1024)
+
+class ResponseCache:
+    """Thread-safe LRU of serialized JSON responses, bounded by total body size"""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> body bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'not_modified': 0}
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def record_not_modified(self):
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes,
+                         max_bytes=self.max_bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+response_cache = ResponseCache()
+
+def cached_json_response(model, key, build):
+    """JSON response for a read-only endpoint, served from the response cache
+
+    `key` holds the route name and its normalised parameters; `build()`
+    returns the payload on a miss. The strong ETag is derived from the
+    model version and the key, so If-None-Match can be answered with a 304
+    without building or even looking up the body. If-None-Match compares
+    weakly, so a W/ tag added by a compressing proxy still matches.
+    """
+    etag = hashlib.sha256(repr((model.version, key)).encode('utf-8')).hexdigest()[:32]
+    if request.if_none_match.contains_weak(etag):
+        response_cache.record_not_modified()
+        response = app.response_class(status=304)
+    else:
+        cache_key = (model.version, key)
+        body = response_cache.get(cache_key)
+        if body is None:
+            body = jsonify(build()).get_data()
+            response_cache.put(cache_key, body)
+        response = app.response_class(body, mimetype='application/json')
+    
+    response.set_etag(etag)
+    # Responses sit behind the login, so only the browser may keep them
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # ============================================================================
 # Routes - Authentication
@@ -170,16 +2887,8 @@ def login():
             return render_template('login.html')
         
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
             password_hash = hash_password(password)
-            cursor.execute(
-                "SELECT user_id, username, email FROM Users WHERE username = ? AND password_hash = ?",
-                (username, password_hash)
-            )
-            user = cursor.fetchone()
-            conn.close()
+            user = store.authenticate(username, password_hash)
             
             if user:
                 # Set session
@@ -239,22 +2948,14 @@ def signup():
             return render_template('signup.html')
         
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
             password_hash = hash_password(password)
-            cursor.execute(
-                "INSERT INTO Users (username, email, password_hash) VALUES (?, ?, ?)",
-                (username, email, password_hash)
-            )
-            conn.commit()
-            conn.close()
+            store.create_user(username, email, password_hash)
             
             print(f"✓ User registered successfully: {username}")
             flash('Account created successfully! Please login.')
             return redirect(url_for('login'))
             
-        except pyodbc.IntegrityError:
+        except DuplicateUserError:
             print("✗ User already exists")
             flash('Username or email already exists')
             return render_template('signup.html')
@@ -279,42 +2980,101 @@ def logout():
 # Routes - Movie API Endpoints
 # ============================================================================
 
+def facet_filters_from_request():
+    """Facet filters from the query string: ?language= (comma separated),
+    ?year_from=, ?year_to=, ?adult=, ?rating= (buckets 0-9, comma separated)
+    and ?min_votes=. Raises ValueError on malformed values."""
+    args = request.args
+    
+    adult = args.get('adult', '').strip().lower()
+    if adult not in ('', 'true', 'false', '1', '0'):
+        raise ValueError("adult must be true or false")
+    try:
+        rating = sorted({int(bucket) for bucket in args.get('rating', '').split(',') if bucket.strip()})
+    except ValueError:
+        raise ValueError("rating must be comma separated buckets 0-9")
+    
+    numbers = {}
+    for name in ('year_from', 'year_to', 'min_votes'):
+        value = args.get(name, '').strip()
+        try:
+            numbers[name] = int(value) if value else None
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+    
+    return {
+        'language': sorted({language.strip().lower() for language in args.get('language', '').split(',')
+                            if language.strip()}),
+        'year_from': numbers['year_from'],
+        'year_to': numbers['year_to'],
+        'adult': adult in ('true', '1') if adult else None,
+        'rating': rating,
+        'min_votes': numbers['min_votes'],
+    }
+
+def blend_from_request():
+    """(name, weights) of the hybrid blend picked by ?blend= (a preset) and
+    ?weights=signal:weight,... overrides. Raises ValueError."""
+    return blend_weights(request.args.get('blend'), request.args.get('weights'))
+
+def blend_summary(name, weights):
+    """JSON description of a blend, echoed so A/B results can be attributed"""
+    return {'name': name, 'weights': dict(zip(HYBRID_SIGNALS, weights.tolist()))}
+
 @app.route('/api/movies')
 def get_movies():
-    """Get paginated list of movies"""
+    """Get paginated list of movies
+
+    ?sort= catalog (default), popularity, rating, release_date or title;
+    ?per_page= up to MAX_PAGE_SIZE; facet filters as in
+    facet_filters_from_request(). Follow next_cursor with ?cursor= for
+    keyset pagination; ?page= keeps working for offset pagination.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    if movies_df is None:
+    model = current_model()
+    if model is None:
         return jsonify({'error': 'Movie data not loaded'}), 500
     
+    browser = model.browser
+    sort = request.args.get('sort', 'catalog')
+    if sort not in browser.orders:
+        return jsonify({'error': f"Unknown sort '{sort}'", 'sorts': list(browser.orders)}), 400
+    
     try:
         page = int(request.args.get('page', 1))
-        per_page = 20
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        
-        movies_page = movies_df.iloc[start_idx:end_idx]
-        
-        movies_list = []
-        for _, movie in movies_page.iterrows():
-            movie_dict = {
-                'title': movie.get('title', 'Unknown'),
-                'release_date': movie.get('release_date', 'N/A'),
-                'vote_average': float(movie.get('vote_average', 0)) if pd.notna(movie.get('vote_average')) else 0,
-                'vote_count': int(movie.get('vote_count', 0)) if pd.notna(movie.get('vote_count')) else 0,
-                'overview': movie.get('overview', 'No overview available'),
-                'genres': movie.get('genres', 'Unknown'),
-                'popularity': float(movie.get('popularity', 0)) if pd.notna(movie.get('popularity')) else 0
+        per_page = max(1, min(int(request.args.get('per_page', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        filters = facet_filters_from_request()
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_sort, value, position = decode_cursor(cursor)
+            if cursor_sort != sort:
+                return jsonify({'error': f"Cursor belongs to sort '{cursor_sort}'"}), 400
+            if not browser.orders[sort].accepts(value):
+                raise ValueError("Invalid cursor")
+            cursor = (value, position)
+        else:
+            cursor = None
+        
+        def build():
+            positions, total, counts, next_cursor = browser.page(sort, filters, per_page,
+                                                                 page=page, cursor=cursor)
+            return {
+                'movies': serialize_movies(model, positions),
+                'total': total,
+                'page': None if cursor else page,
+                'per_page': per_page,
+                'sort': sort,
+                'next_cursor': next_cursor,
+                'facets': counts
             }
-            movies_list.append(movie_dict)
         
-        return jsonify({
-            'movies': movies_list,
-            'total': len(movies_df),
-            'page': page,
-            'per_page': per_page
-        })
+        key = ('movies', sort, facet_filter_key(filters), per_page, request.args.get('cursor') or page)
+        return cached_json_response(model, key, build)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error in get_movies: {e}")
         return jsonify({'error': str(e)}), 500
@@ -325,35 +3085,33 @@ def search_movies():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    if movies_df is None:
+    model = current_model()
+    if model is None:
         return jsonify({'error': 'Movie data not loaded'}), 500
     
     query = request.args.get('q', '').lower()
-    if not query:
+    if not query.strip():
         return jsonify({'movies': []})
     
     try:
-        # Search in title, overview, and genres
-        filtered = movies_df[
-            movies_df['title'].str.lower().str.contains(query, na=False) |
-            movies_df['overview'].str.lower().str.contains(query, na=False) |
-            movies_df['genres'].str.lower().str.contains(query, na=False)
-        ]
-        
-        movies_list = []
-        for _, movie in filtered.head(20).iterrows():
-            movie_dict = {
-                'title': movie.get('title', 'Unknown'),
-                'release_date': movie.get('release_date', 'N/A'),
-                'vote_average': float(movie.get('vote_average', 0)) if pd.notna(movie.get('vote_average')) else 0,
-                'vote_count': int(movie.get('vote_count', 0)) if pd.notna(movie.get('vote_count')) else 0,
-                'overview': movie.get('overview', 'No overview available'),
-                'genres': movie.get('genres', 'Unknown'),
-                'popularity': float(movie.get('popularity', 0)) if pd.notna(movie.get('popularity')) else 0
-            }
-            movies_list.append(movie_dict)
+        filters = facet_filters_from_request()
+        activity_log.record(session['user_id'], 'search', query.strip())
+        
+        # Search in title, overview, and genres via the inverted index
+        candidates, scores = model.search_index.score(query)
+        selection = model.facets.select(filters)
+        if selection is not None:
+            kept = model.facets.contains(selection, candidates)
+            candidates, scores = candidates[kept], scores[kept]
+        movies_list = serialize_movies(model, candidates[top_k_indices(scores, 20)])
         
-        return jsonify({'movies': movies_list})
+        return jsonify({
+            'movies': movies_list,
+            'total': len(candidates),
+            'facets': model.facets.counts(candidates)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error in search_movies: {e}")
         return jsonify({'error': str(e)}), 500
@@ -364,81 +3122,514 @@ def get_popular():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    if movies_df is None:
+    model = current_model()
+    if model is None:
         return jsonify({'error': 'Movie data not loaded'}), 500
     
+    # ?order= popularity (default), rating or trending
+    popularity_orders = model.popularity_orders
+    order = request.args.get('order', next(iter(popularity_orders), 'popularity'))
+    if order not in popularity_orders:
+        return jsonify({'error': f"Unknown order '{order}'",
+                        'orders': list(popularity_orders)}), 400
+    
     try:
-        # Sort by popularity or rating
-        if 'popularity' in movies_df.columns:
-            popular = movies_df.sort_values('popularity', ascending=False)
-        elif 'vote_average' in movies_df.columns and 'vote_count' in movies_df.columns:
-            movies_df['weighted_rating'] = movies_df['vote_average'] * movies_df['vote_count']
-            popular = movies_df.sort_values('weighted_rating', ascending=False)
-        else:
-            popular = movies_df
-        
-        movies_list = []
-        for _, movie in popular.head(20).iterrows():
-            movie_dict = {
-                'title': movie.get('title', 'Unknown'),
-                'release_date': movie.get('release_date', 'N/A'),
-                'vote_average': float(movie.get('vote_average', 0)) if pd.notna(movie.get('vote_average')) else 0,
-                'vote_count': int(movie.get('vote_count', 0)) if pd.notna(movie.get('vote_count')) else 0,
-                'overview': movie.get('overview', 'No overview available'),
-                'genres': movie.get('genres', 'Unknown'),
-                'popularity': float(movie.get('popularity', 0)) if pd.notna(movie.get('popularity')) else 0
-            }
-            movies_list.append(movie_dict)
+        limit = request.args.get('limit', DEFAULT_POPULAR_LIMIT, type=int)
+        limit = max(1, min(limit, MAX_POPULAR_LIMIT))
+        page = max(request.args.get('page', 1, type=int), 1)
+        start_idx = (page - 1) * limit
         
-        return jsonify({'movies': movies_list})
+        ranking = popularity_orders[order]
+        
+        return cached_json_response(model, ('popular', order, page, limit), lambda: {
+            'movies': serialize_movies(model, ranking[start_idx:start_idx + limit]),
+            'order': order,
+            'page': page,
+            'limit': limit
+        })
     except Exception as e:
         print(f"Error in get_popular: {e}")
         return jsonify({'error': str(e)}), 500
 
+def recommendations_response(model, idx):
+    """JSON response with the movies most similar to row position `idx`,
+    re-ranked with rating, popularity and recency priors for a hybrid ?blend="""
+    k = request.args.get('k', DEFAULT_RECOMMENDATIONS, type=int)
+    k = max(1, min(k, MAX_RECOMMENDATIONS))
+    filters = facet_filters_from_request()
+    blend, weights = blend_from_request()
+    hybrid = not is_content_blend(weights)
+    activity_log.record(session['user_id'], 'view', str(model.columns['title'][idx]))
+    
+    def build():
+        selection = model.facets.select(filters)
+        if hybrid:
+            positions = hybrid_similar_movies(model, idx, k, weights, selection)
+        elif selection is None:
+            positions = similar_movies(model, idx, k)
+        else:
+            positions = filtered_similar_movies(model, idx, k, selection)
+        response = {'recommendations': serialize_movies(model, positions)}
+        if selection is not None:
+            response['facets'] = model.facets.counts(positions)
+        if hybrid:
+            response['blend'] = blend_summary(blend, weights)
+        return response
+    
+    # Keyed by row position, so every title / id spelling of a movie shares an entry
+    blend_key = (blend, tuple(weights.tolist())) if hybrid else None
+    return cached_json_response(model, ('recommendations', int(idx), k, facet_filter_key(filters), blend_key),
+                                build)
+
 @app.route('/api/recommendations/<movie_title>')
 def get_recommendations(movie_title):
     """Get movie recommendations based on content similarity"""
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    if movies_df is None or cosine_sim is None:
+    model = current_model()
+    if model is None:
         return jsonify({'error': 'Recommendation engine not initialized'}), 500
     
     try:
-        # Find the movie
-        matches = movies_df[movies_df['title'].str.lower() == movie_title.lower()]
+        # Find the movie (?year= or ?id= pick between movies sharing a title)
+        idx = find_movie(model, movie_title,
+                         year=request.args.get('year', type=int),
+                         movie_id=request.args.get('id', type=int))
         
-        if matches.empty:
+        if idx is None:
             return jsonify({'error': 'Movie not found', 'recommendations': []})
         
-        idx = matches.index[0]
-        
-        # Get similarity scores
-        sim_scores = list(enumerate(cosine_sim[idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        sim_scores = sim_scores[1:11]  # Top 10 similar movies (excluding itself)
-        
-        movie_indices = [i[0] for i in sim_scores]
-        recommended_movies = movies_df.iloc[movie_indices]
-        
-        recommendations = []
-        for _, movie in recommended_movies.iterrows():
-            movie_dict = {
-                'title': movie.get('title', 'Unknown'),
-                'release_date': movie.get('release_date', 'N/A'),
-                'vote_average': float(movie.get('vote_average', 0)) if pd.notna(movie.get('vote_average')) else 0,
-                'vote_count': int(movie.get('vote_count', 0)) if pd.notna(movie.get('vote_count')) else 0,
-                'overview': movie.get('overview', 'No overview available'),
-                'genres': movie.get('genres', 'Unknown'),
-                'popularity': float(movie.get('popularity', 0)) if pd.notna(movie.get('popularity')) else 0
-            }
-            recommendations.append(movie_dict)
-        
-        return jsonify({'recommendations': recommendations})
+        return recommendations_response(model, idx)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'recommendations': []}), 400
     except Exception as e:
         print(f"Error in get_recommendations: {e}")
         return jsonify({'error': str(e), 'recommendations': []}), 500
 
+@app.route('/api/recommendations/by-id/<int:movie_id>')
+def get_recommendations_by_id(movie_id):
+    """Get movie recommendations for a movie by its dataset id"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    model = current_model()
+    if model is None:
+        return jsonify({'error': 'Recommendation engine not initialized'}), 500
+    
+    try:
+        idx = model.movie_id_index.get(movie_id)
+        
+        if idx is None:
+            return jsonify({'error': 'Movie not found', 'recommendations': []})
+        
+        return recommendations_response(model, idx)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'recommendations': []}), 400
+    except Exception as e:
+        print(f"Error in get_recommendations_by_id: {e}")
+        return jsonify({'error': str(e), 'recommendations': []}), 500
+
+def is_int64(value):
+    """True for a JSON integer (not a bool or float) that fits in int64"""
+    return (isinstance(value, int) and not isinstance(value, bool) and
+            np.iinfo(np.int64).min <= value <= np.iinfo(np.int64).max)
+
+@app.route('/api/recommendations/batch', methods=['POST'])
+def get_batch_recommendations():
+    """Recommendations for many seeds at once: {"titles": [...], "ids": [...], "k": 10}
+
+    Results are keyed by the input title or id; seeds that are not in the
+    catalog are listed under not_found.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    model = current_model()
+    if model is None:
+        return jsonify({'error': 'Recommendation engine not initialized'}), 500
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected {"titles": [...], "ids": [...]}'}), 400
+    titles = payload.get('titles') or []
+    ids = payload.get('ids') or []
+    if not isinstance(titles, list) or not isinstance(ids, list):
+        return jsonify({'error': 'Expected {"titles": [...], "ids": [...]}'}), 400
+    if len(titles) + len(ids) > MAX_BATCH_SEEDS:
+        return jsonify({'error': f'At most {MAX_BATCH_SEEDS} titles and ids per request'}), 400
+    if not all(isinstance(title, str) for title in titles):
+        return jsonify({'error': 'titles must be strings'}), 400
+    # Exact JSON integers only: 1.7 is not an id, and ids must fit the int64 lookup
+    if not all(is_int64(movie_id) for movie_id in ids):
+        return jsonify({'error': 'ids must be integers'}), 400
+    k = payload.get('k', DEFAULT_RECOMMENDATIONS)
+    if not is_int64(k):
+        return jsonify({'error': 'k must be an integer'}), 400
+    k = max(1, min(k, MAX_RECOMMENDATIONS))
+    
+    try:
+        # Resolve every seed to a row position first
+        seeds = []  # (section, key, position)
+        not_found = {'titles': [], 'ids': []}
+        for title in dict.fromkeys(titles):
+            pos = find_movie(model, title)
+            if pos is None:
+                not_found['titles'].append(title)
+            else:
+                seeds.append(('titles', title, pos))
+        ids = list(dict.fromkeys(ids))
+        for movie_id, pos in zip(ids, model.movie_id_index.lookup(ids).tolist()):
+            if pos < 0:
+                not_found['ids'].append(movie_id)
+            else:
+                seeds.append(('ids', str(movie_id), pos))
+        
+        results = {'titles': {}, 'ids': {}}
+        if seeds:
+            neighbors = similar_movies_batch(model, [pos for _, _, pos in seeds], k)
+            
+            # Serialize each distinct movie once and share it between seeds
+            unique, inverse = np.unique(neighbors, return_inverse=True)
+            movies = serialize_movies(model, unique)
+            inverse = inverse.reshape(neighbors.shape)
+            for (section, key, _), row in zip(seeds, inverse):
+                results[section][key] = [movies[i] for i in row]
+        
+        return jsonify({'recommendations': results, 'not_found': not_found, 'k': k})
+    except Exception as e:
+        print(f"Error in get_batch_recommendations: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/recommendations/me')
+def get_personal_recommendations():
+    """Get recommendations from the logged-in user's rated movies"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    model = current_model()
+    if model is None:
+        return jsonify({'error': 'Recommendation engine not initialized'}), 500
+    
+    try:
+        k = request.args.get('k', DEFAULT_RECOMMENDATIONS, type=int)
+        k = max(1, min(k, MAX_RECOMMENDATIONS))
+        
+        filters = facet_filters_from_request()
+        blend, weights = blend_from_request()
+        
+        profile, seen = user_profile(model, session['user_id'])
+        if profile is None:
+            return jsonify({'error': 'Rate some movies to get personal recommendations',
+                            'recommendations': []})
+        
+        selection = model.facets.select(filters)
+        positions = personalised_movies(model, profile, seen, k, selection, weights)
+        response = {'recommendations': serialize_movies(model, positions)}
+        if selection is not None:
+            response['facets'] = model.facets.counts(positions)
+        if not is_content_blend(weights):
+            response['blend'] = blend_summary(blend, weights)
+        
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'recommendations': []}), 400
+    except Exception as e:
+        print(f"Error in get_personal_recommendations: {e}")
+        return jsonify({'error': str(e), 'recommendations': []}), 500
+
+# ============================================================================
+# Routes - Watchlist & Preferences
+# ============================================================================
+MAX_BULK_RATINGS = 5000
+
+def movie_from_json(model, item):
+    """(movie_id, catalog title) for {"movie_id": ...} or {"movie_title": ..., "year": ...}
+
+    Raises ValueError for a malformed reference and LookupError if the movie
+    is not in the catalog.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Each movie must be an object')
+    if item.get('movie_id') is not None:
+        movie_id = item['movie_id']
+        if isinstance(movie_id, str) and movie_id.strip().lstrip('-').isdigit():
+            movie_id = int(movie_id)
+        if not is_int64(movie_id):
+            raise ValueError('movie_id must be an integer')
+        pos = model.movie_id_index.get(movie_id)
+    else:
+        movie_title = str(item.get('movie_title') or '').strip()
+        if not movie_title:
+            raise ValueError('movie_id or movie_title is required')
+        pos = find_movie(model, movie_title, year=item.get('year'))
+    
+    movie_id = model.movie_id_index.id_at(pos) if pos is not None else None
+    if movie_id is None:
+        raise LookupError(item.get('movie_id', item.get('movie_title')))
+    return movie_id, model.columns['title'][pos]
+
+def rating_from_json(model, item):
+    """(movie_id, movie_title, rating, is_favorite) from a JSON rating; raises
+    ValueError or LookupError like movie_from_json()"""
+    movie_id, movie_title = movie_from_json(model, item)
+    rating = item.get('rating')
+    if rating is not None:
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            raise ValueError('rating must be a number')
+        low, high = USER_RATING_RANGE
+        if not low <= rating <= high:  # Also rejects NaN
+            raise ValueError(f'rating must be between {low:g} and {high:g}')
+    return movie_id, movie_title, rating, bool(item.get('is_favorite', False))
+
+def preferences_written(user_id, items):
+    """Bookkeeping after ratings reach the database"""
+    cache_upsert_preferences(user_id, items)
+    invalidate_user_profile(user_id)
+    for _, movie_title, _, is_favorite in items:
+        activity_log.record(user_id, 'favorite' if is_favorite else 'rate', movie_title)
+
+@app.route('/api/preferences', methods=['GET'])
+def get_preferences():
+    """The logged-in user's ratings, most recent first"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({'preferences': user_data(session['user_id'], 'preferences')})
+    except Exception as e:
+        print(f"Error in get_preferences: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/preferences', methods=['POST'])
+def save_preference():
+    """Rate a movie: {"movie_id": 550, "rating": 4.5, "is_favorite": false}
+    (or "movie_title" instead of "movie_id")"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    model = current_model()
+    if model is None:
+        return jsonify({'error': 'Recommendation engine not initialized'}), 500
+    
+    try:
+        item = rating_from_json(model, request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError:
+        return jsonify({'error': 'Movie not found'}), 404
+    
+    try:
+        store.add_preference(session['user_id'], *item)
+        preferences_written(session['user_id'], [item])
+        
+        return jsonify({'success': True})
+    except Exception as e:
+        print(f"Error in save_preference: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/preferences/bulk', methods=['POST'])
+def import_preferences():
+    """Rate many movies in one batched write: {"ratings": [{...}, ...]}
+
+    Ratings for movies that are not in the catalog are skipped and listed
+    under not_found.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    model = current_model()
+    if model is None:
+        return jsonify({'error': 'Recommendation engine not initialized'}), 500
+    
+    payload = request.get_json(silent=True)
+    ratings = payload.get('ratings') if isinstance(payload, dict) else None
+    if not isinstance(ratings, list):
+        return jsonify({'error': 'Expected {"ratings": [ {...}, ... ]}'}), 400
+    if len(ratings) > MAX_BULK_RATINGS:
+        return jsonify({'error': f'At most {MAX_BULK_RATINGS} ratings per request'}), 400
+    
+    # One row per movie, the last rating wins (MERGE rejects duplicate source rows)
+    items, not_found = {}, []
+    try:
+        for rating in ratings:
+            try:
+                item = rating_from_json(model, rating)
+                items[item[0]] = item
+            except LookupError as e:
+                not_found.append(e.args[0])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    items = list(items.values())
+    
+    try:
+        if items:
+            store.add_preferences(session['user_id'], items)
+            preferences_written(session['user_id'], items)
+        
+        return jsonify({'success': True, 'count': len(items), 'not_found': not_found})
+    except Exception as e:
+        print(f"Error in import_preferences: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/preferences/<int:movie_id>', methods=['DELETE'])
+def delete_preference(movie_id):
+    """Remove the logged-in user's rating for a movie"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        removed = store.remove_preference(session['user_id'], movie_id)
+        if not removed:
+            return jsonify({'error': 'No rating for this movie'}), 404
+        
+        cache_remove(session['user_id'], 'preferences', movie_id)
+        invalidate_user_profile(session['user_id'])
+        return jsonify({'success': True})
+    except Exception as e:
+        print(f"Error in delete_preference: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/watchlist', methods=['GET'])
+def get_watchlist():
+    """The logged-in user's watchlist, most recently added first"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        return jsonify({'watchlist': user_data(session['user_id'], 'watchlist')})
+    except Exception as e:
+        print(f"Error in get_watchlist: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/watchlist', methods=['POST'])
+def add_to_watchlist():
+    """Add a movie to the watchlist: {"movie_id": 550} (or "movie_title")"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    model = current_model()
+    if model is None:
+        return jsonify({'error': 'Recommendation engine not initialized'}), 500
+    
+    try:
+        movie_id, movie_title = movie_from_json(model, request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError:
+        return jsonify({'error': 'Movie not found'}), 404
+    
+    try:
+        store.add_to_watchlist(session['user_id'], movie_id, movie_title)
+        cache_add_to_watchlist(session['user_id'], movie_id, movie_title)
+        
+        return jsonify({'success': True})
+    except Exception as e:
+        print(f"Error in add_to_watchlist: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/watchlist/<int:movie_id>', methods=['DELETE'])
+def remove_from_watchlist(movie_id):
+    """Remove a movie from the watchlist"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        removed = store.remove_from_watchlist(session['user_id'], movie_id)
+        if not removed:
+            return jsonify({'error': 'Movie is not in the watchlist'}), 404
+        
+        cache_remove(session['user_id'], 'watchlist', movie_id)
+        return jsonify({'success': True})
+    except Exception as e:
+        print(f"Error in remove_from_watchlist: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# ============================================================================
+# Routes - Admin
+# ============================================================================
+ADMIN_TOKEN = os.environ.get('MOVIERECOMM_ADMIN_TOKEN')
+
+def is_admin_request():
+    """True if the request carries the admin token (admin routes are off without one)"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+@app.route('/api/admin/movies', methods=['POST'])
+def admin_ingest_movies():
+    """Append movies to the live catalog: {"movies": [{...}, ...], "persist": true}"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    payload = request.get_json(silent=True)
+    records = payload.get('movies') if isinstance(payload, dict) else None
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return jsonify({'error': 'Expected {"movies": [ {...}, ... ]}'}), 400
+    if len(records) > MAX_INGEST_ROWS:
+        return jsonify({'error': f'At most {MAX_INGEST_ROWS} movies per request'}), 400
+    
+    try:
+        return jsonify(ingest_movies(records, persist=bool(payload.get('persist', True))))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in admin_ingest_movies: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/db-pool')
+def get_db_pool_stats():
+    """Database connection pool metrics"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return jsonify(dict(store.pool.stats(), backend=store.name))
+
+@app.route('/api/admin/activity')
+def get_activity_log_stats():
+    """User activity pipeline: queued, written, dropped and failed events"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return jsonify(activity_log.stats())
+
+@app.route('/api/admin/cache')
+def get_response_cache_stats():
+    """Response cache size and hit / miss counts"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return jsonify(response_cache.stats())
+
+@app.route('/api/admin/model')
+def get_model_status():
+    """Version of the model being served and the state of the last reload"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    model = current_model()
+    with reload_state_lock:
+        state = dict(reload_state)
+    return jsonify({
+        'version': model.version if model else None,
+        'engine': model.engine.name if model else None,
+        'movies': len(model) if model else 0,
+        'vocabulary_drift': model.vocabulary_drift if model else None,
+        'created_at': model.created_at if model else None,
+        'retired_snapshots': len(retired_snapshots),
+        'reload': state
+    })
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload_model():
+    """Rebuild the model from disk in the background and swap it in"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    reload_model_async('admin request')
+    return jsonify({'status': 'reloading'}), 202
+
 # ============================================================================
 # Run Application
 # ============================================================================
@@ -454,6 +3645,7 @@ if __name__ == '__main__':
     
     # Load movie data
     load_movies_data()
+    start_model_watcher()
     
     print()
     print("=" * 70)
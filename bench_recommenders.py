@@ -0,0 +1,80 @@
+"""
+MOVIERECOMM™ - Similarity Engine Benchmark
+Compares the approximate and latent-space similarity engines against exact
+TF-IDF scoring on the loaded catalog: build time, memory, query latency and
+recall@K (overlap with the exact top-K).
+
+Usage: python bench_recommenders.py [queries] [K]
+"""
+
+import sys
+import time
+import numpy as np
+import app
+
+# (engine, options) pairs to measure. IVF trades recall for latency through
+# the fraction of clusters probed (probes / lists); LSA through the number
+# of latent dimensions
+CANDIDATES = [
+    ('ivf', {'lists': 100, 'probes': 4}),
+    ('ivf', {'lists': 100, 'probes': 8}),
+    ('ivf', {'lists': 100, 'probes': 16}),
+    ('ivf', {'lists': 100, 'probes': 32}),
+    ('ivf', {'lists': 400, 'probes': 32}),
+    ('lsa', {'dimensions': 64}),
+    ('lsa', {'dimensions': 128}),
+    ('lsa', {'dimensions': 256}),
+]
+
+def measure(engine, queries, k):
+    """Query latencies in ms and the result lists for each query"""
+    times, results = [], []
+    for idx in queries:
+        started = time.perf_counter()
+        results.append(engine.query(idx, k))
+        times.append(time.perf_counter() - started)
+    return np.asarray(times) * 1000, results
+
+def report(label, engine, build_seconds, times, results, truth):
+    recall = np.mean([len(np.intersect1d(found, expected)) / len(expected)
+                      for found, expected in zip(results, truth)])
+    print(f"  {label:28s} build {build_seconds:6.2f} s   {engine.nbytes / 1024 / 1024:7.2f} MB   "
+          f"p50 {np.percentile(times, 50):6.2f} ms   p99 {np.percentile(times, 99):6.2f} ms   "
+          f"recall {recall:.3f}")
+
+def main():
+    queries = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    print("=" * 70)
+    print(f"MOVIERECOMM™ - Similarity Engine Benchmark ({queries} queries, recall@{k})")
+    print("=" * 70)
+
+    app.load_movies_data()
+    model = app.current_model()
+    if model is None:
+        print("✗ Movie data could not be loaded, nothing to benchmark")
+        return False
+
+    matrix = model.tfidf_matrix
+    sample = np.random.default_rng(0).choice(matrix.shape[0], min(queries, matrix.shape[0]), replace=False)
+
+    started = time.perf_counter()
+    exact = app.ExactEngine(matrix)
+    build_seconds = time.perf_counter() - started
+    times, truth = measure(exact, sample, k)
+    print(f"\nCatalog: {matrix.shape[0]} movies x {matrix.shape[1]} terms")
+    report("exact", exact, build_seconds, times, truth, truth)
+
+    for name, options in CANDIDATES:
+        started = time.perf_counter()
+        engine = app.RECOMMENDER_ENGINES[name](matrix, **options)
+        build_seconds = time.perf_counter() - started
+        times, results = measure(engine, sample, k)
+        label = f"{name} " + " ".join(f"{key}={value}" for key, value in options.items())
+        report(label, engine, build_seconds, times, results, truth)
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
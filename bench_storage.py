@@ -0,0 +1,72 @@
+"""
+MOVIERECOMM™ - Storage Backend Benchmark
+Load-tests login and preference writes against a storage backend so the
+MSSQL and SQLite implementations can be compared.
+
+Usage: python bench_storage.py [mssql|sqlite] [threads] [operations per thread]
+"""
+
+import sys
+import threading
+import time
+import numpy as np
+import app
+
+def run(store, threads, ops):
+    """Run `ops` login + preference round trips on each of `threads` threads"""
+    password_hash = app.hash_password('benchmark')
+    user_ids = []
+    for i in range(threads):
+        username = f"bench_{i}"
+        try:
+            store.create_user(username, f"{username}@bench.local", password_hash)
+        except app.DuplicateUserError:
+            pass
+        user_ids.append(store.authenticate(username, password_hash)[0])
+    
+    login_times = [[] for _ in range(threads)]
+    write_times = [[] for _ in range(threads)]
+    
+    def worker(i):
+        username = f"bench_{i}"
+        for op in range(ops):
+            started = time.perf_counter()
+            store.authenticate(username, password_hash)
+            login_times[i].append(time.perf_counter() - started)
+            
+            started = time.perf_counter()
+            store.add_preference(user_ids[i], op % 100, f"Benchmark Movie {op % 100}", rating=op % 10)
+            write_times[i].append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    
+    print(f"Throughput: {threads * ops / elapsed:,.1f} login + preference round trips/s")
+    for label, samples in (("login", login_times), ("preference write", write_times)):
+        ms = np.concatenate([np.asarray(s) for s in samples]) * 1000
+        print(f"  {label:18s} p50 {np.percentile(ms, 50):7.2f} ms   "
+              f"p99 {np.percentile(ms, 99):7.2f} ms   busy {ms.sum() / 1000:6.2f} s")
+
+def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else app.STORAGE_BACKEND
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    ops = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    
+    print("=" * 70)
+    print(f"MOVIERECOMM™ - Storage Benchmark ({backend}, {threads} threads x {ops} ops)")
+    print("=" * 70)
+    
+    store = app.create_store(backend)
+    store.init_schema()
+    run(store, threads, ops)
+    print(f"Pool: {store.pool.stats()}")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
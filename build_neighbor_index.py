@@ -0,0 +1,29 @@
+"""
+MOVIERECOMM™ - Neighbor Index Builder
+Precomputes the top-K similar movies for every title and writes them to a
+binary file that all gunicorn workers memory-map and share.
+
+Usage: python build_neighbor_index.py [K]
+"""
+
+import sys
+import app
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else app.NEIGHBOR_INDEX_K
+    
+    print("=" * 70)
+    print("MOVIERECOMM™ - Building Neighbor Index")
+    print("=" * 70)
+    
+    app.load_movies_data()
+    if app.current_model() is None:
+        print("✗ Movie data could not be loaded, nothing to build")
+        return False
+    
+    app.build_neighbor_index(k=k)
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,33 @@
+"""
+MOVIERECOMM™ - Gunicorn configuration
+Run with: gunicorn app:app
+"""
+
+import os
+
+bind = "0.0.0.0:5000"
+workers = 4
+
+# Threaded workers: a request blocked on the database (login, signup,
+# preference writes) parks only its own thread, while the others keep
+# serving recommendations. Concurrent queries are bounded by the DB pool.
+worker_class = "gthread"
+threads = int(os.environ.get("MOVIERECOMM_WORKER_THREADS", 8))
+
+def post_worker_init(worker):
+    """Create the database tables and load the movie catalog in each worker.
+
+    Every schema statement is IF NOT EXISTS, so running it in each worker
+    is harmless. The neighbor index is memory-mapped, so all workers share
+    a single page-cache copy of it. Each worker also watches the source
+    files and hot-swaps its model when they change.
+    """
+    import app
+    app.init_database()
+    app.load_movies_data()
+    app.start_model_watcher()
+
+def worker_exit(server, worker):
+    """Flush buffered user activity events before the worker exits"""
+    import app
+    app.activity_log.close()
@@ -0,0 +1,59 @@
+"""
+MOVIERECOMM™ - Catalog Ingestion
+Sends new movies from a CSV file (same columns as movies.csv) to a running
+server, which adds them to its live catalog without a restart or refit.
+
+Usage: python ingest_movies.py new_movies.csv [server_url]
+Requires MOVIERECOMM_ADMIN_TOKEN to match the server's admin token.
+"""
+
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+import pandas as pd
+
+BATCH_SIZE = 1000
+
+def post_batch(url, token, records):
+    body = json.dumps({'movies': records, 'persist': True}).encode('utf-8')
+    req = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Admin-Token': token
+    })
+    with urllib.request.urlopen(req) as response:
+        return json.load(response)
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return False
+    
+    csv_path = sys.argv[1]
+    url = (sys.argv[2] if len(sys.argv) > 2 else 'http://localhost:5000').rstrip('/') + '/api/admin/movies'
+    token = os.environ.get('MOVIERECOMM_ADMIN_TOKEN')
+    if not token:
+        print("✗ Set MOVIERECOMM_ADMIN_TOKEN first")
+        return False
+    
+    df = pd.read_csv(csv_path, encoding='utf-8')
+    # NaN is not valid JSON
+    records = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+    print(f"Ingesting {len(records)} movies from {csv_path} into {url}")
+    
+    try:
+        for start in range(0, len(records), BATCH_SIZE):
+            result = post_batch(url, token, records[start:start + BATCH_SIZE])
+            print(f"✓ Batch {start // BATCH_SIZE + 1}: {result}")
+    except urllib.error.HTTPError as e:
+        print(f"✗ Server rejected batch: {e.code} {e.read().decode('utf-8', 'replace')}")
+        return False
+    except urllib.error.URLError as e:
+        print(f"✗ Could not reach server: {e.reason}")
+        return False
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
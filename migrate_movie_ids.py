@@ -0,0 +1,50 @@
+"""
+MOVIERECOMM™ - Movie Id Migration
+Converts UserPreferences and Watchlist rows written before movies were keyed
+by id: each stored title is matched against the catalog, the row gets the
+movie's id, and the tables are re-keyed on (user_id, movie_id).
+
+Usage: python migrate_movie_ids.py [--delete-unmatched]
+Titles that match no movie abort the migration unless --delete-unmatched is
+given, in which case those rows are dropped. Runs in a single transaction.
+"""
+
+import sys
+import app
+
+def main():
+    delete_unmatched = '--delete-unmatched' in sys.argv[1:]
+    
+    print("=" * 70)
+    print(f"MOVIERECOMM™ - Migrating preferences to movie ids ({app.store.name})")
+    print("=" * 70)
+    
+    if app.store.movie_ids_migrated():
+        print("✓ Tables are already keyed by movie id")
+        return True
+    
+    app.load_movies_data()
+    model = app.current_model()
+    if model is None:
+        print("✗ Movie data could not be loaded, titles can't be matched")
+        return False
+    
+    def resolve(title):
+        pos = app.find_movie(model, title)
+        return model.movie_id_index.id_at(pos) if pos is not None else None
+    
+    try:
+        report = app.store.migrate_movie_ids(resolve, delete_unmatched=delete_unmatched)
+    except ValueError as e:
+        print(f"✗ {e}")
+        print("  Nothing was changed. Rerun with --delete-unmatched to drop those rows.")
+        return False
+    
+    for table, counts in report.items():
+        print(f"✓ {table}: {counts['rows']} rows keyed by movie id "
+              f"({counts['unmatched']} unmatched dropped, {counts['duplicates']} duplicates merged)")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -49,23 +49,26 @@ GO
 -- =============================================
 -- Step 3: Create UserPreferences Table
 -- =============================================
+-- Rows are keyed by the movies.csv id. Databases created with title-keyed
+-- tables are converted by migrate_movie_ids.py
 IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[UserPreferences]') AND type in (N'U'))
 BEGIN
     CREATE TABLE [dbo].[UserPreferences] (
         [pref_id] INT IDENTITY(1,1) PRIMARY KEY,
         [user_id] INT NOT NULL,
-        [movie_title] VARCHAR(500),
-        [movie_id] VARCHAR(50) NULL,
+        [movie_id] INT NOT NULL,           -- id column of movies.csv
+        [movie_title] VARCHAR(500) NULL,   -- display only, not indexed
         [rating] FLOAT NULL,
         [watched_date] DATETIME DEFAULT GETDATE(),
         [is_favorite] BIT DEFAULT 0,
         CONSTRAINT FK_UserPreferences_Users FOREIGN KEY ([user_id]) 
-            REFERENCES [dbo].[Users]([user_id]) ON DELETE CASCADE
+            REFERENCES [dbo].[Users]([user_id]) ON DELETE CASCADE,
+        CONSTRAINT UQ_UserPreferences_User_Movie UNIQUE ([user_id], [movie_id])
     );
     
     -- Create index for better query performance
     CREATE INDEX IX_UserPreferences_UserId ON [dbo].[UserPreferences](user_id);
-    CREATE INDEX IX_UserPreferences_MovieTitle ON [dbo].[UserPreferences](movie_title);
+    CREATE INDEX IX_UserPreferences_MovieId ON [dbo].[UserPreferences](movie_id);
     
     PRINT 'UserPreferences table created successfully.';
 END
@@ -83,12 +86,13 @@ BEGIN
     CREATE TABLE [dbo].[Watchlist] (
         [watchlist_id] INT IDENTITY(1,1) PRIMARY KEY,
         [user_id] INT NOT NULL,
-        [movie_title] VARCHAR(500) NOT NULL,
-        [movie_id] VARCHAR(50) NULL,
+        [movie_id] INT NOT NULL,
+        [movie_title] VARCHAR(500) NULL,
         [added_date] DATETIME DEFAULT GETDATE(),
         [watched] BIT DEFAULT 0,
         CONSTRAINT FK_Watchlist_Users FOREIGN KEY ([user_id]) 
-            REFERENCES [dbo].[Users]([user_id]) ON DELETE CASCADE
+            REFERENCES [dbo].[Users]([user_id]) ON DELETE CASCADE,
+        CONSTRAINT UQ_Watchlist_User_Movie UNIQUE ([user_id], [movie_id])
     );
     
     CREATE INDEX IX_Watchlist_UserId ON [dbo].[Watchlist](user_id);
@@ -211,7 +215,8 @@ GO
 
 CREATE PROCEDURE [dbo].[sp_AddMoviePreference]
     @user_id INT,
-    @movie_title VARCHAR(500),
+    @movie_id INT,
+    @movie_title VARCHAR(500) = NULL,
     @rating FLOAT = NULL,
     @is_favorite BIT = 0
 AS
@@ -220,18 +225,19 @@ BEGIN
     
     BEGIN TRY
         -- Check if preference already exists
-        IF EXISTS (SELECT 1 FROM UserPreferences WHERE user_id = @user_id AND movie_title = @movie_title)
+        IF EXISTS (SELECT 1 FROM UserPreferences WHERE user_id = @user_id AND movie_id = @movie_id)
         BEGIN
             -- Update existing preference
             UPDATE UserPreferences
-            SET rating = @rating, is_favorite = @is_favorite, watched_date = GETDATE()
-            WHERE user_id = @user_id AND movie_title = @movie_title;
+            SET movie_title = @movie_title, rating = @rating, is_favorite = @is_favorite,
+                watched_date = GETDATE()
+            WHERE user_id = @user_id AND movie_id = @movie_id;
         END
         ELSE
         BEGIN
             -- Insert new preference
-            INSERT INTO UserPreferences (user_id, movie_title, rating, is_favorite)
-            VALUES (@user_id, @movie_title, @rating, @is_favorite);
+            INSERT INTO UserPreferences (user_id, movie_id, movie_title, rating, is_favorite)
+            VALUES (@user_id, @movie_id, @movie_title, @rating, @is_favorite);
         END
         
         SELECT 'SUCCESS' AS Status, 'Preference saved' AS Message;
@@ -255,6 +261,7 @@ BEGIN
     
     SELECT 
         pref_id,
+        movie_id,
         movie_title,
         rating,
         watched_date,
@@ -303,11 +310,11 @@ VALUES ('testuser', 'test@example.com', 'ecd71870d1963316a97e3ac3408c9835ad8cf0f
 -- Test Preferences
 DECLARE @test_user_id INT = (SELECT user_id FROM Users WHERE username = 'testuser');
 
-INSERT INTO UserPreferences (user_id, movie_title, rating, is_favorite)
+INSERT INTO UserPreferences (user_id, movie_id, movie_title, rating, is_favorite)
 VALUES 
-    (@test_user_id, 'The Shawshank Redemption', 9.5, 1),
-    (@test_user_id, 'The Godfather', 9.0, 1),
-    (@test_user_id, 'The Dark Knight', 8.8, 0);
+    (@test_user_id, 278, 'The Shawshank Redemption', 9.5, 1),
+    (@test_user_id, 238, 'The Godfather', 9.0, 1),
+    (@test_user_id, 155, 'The Dark Knight', 8.8, 0);
 */
 
 -- =============================================